@@ -0,0 +1,259 @@
+"""Benchmark cases.
+
+Each case is a function returning the callable to time, so that building
+datatypes and values is not measured.  Cases are registered in `cases`, in
+the order they are run.
+"""
+
+import json
+
+from collections import OrderedDict
+
+from datatype.coercion import coerce_step, coerce_value
+from datatype import decoding
+from datatype.compiler import compile, results
+from datatype.decorators import accepts, returns, returns_iter
+from datatype.language import choice, literal, named, reference, tagged_union
+from datatype.tools import walk
+from datatype.validation import failures, is_valid, validate_step
+
+
+# name -> setup function, returning the callable to time
+cases = OrderedDict()
+
+
+def case(fn):
+    cases[fn.__name__] = fn
+    return fn
+
+
+def walk_failures(datatype, value):
+    """Failures of `value`, the way validation worked before compilation."""
+    fails = []
+
+    def callback(path, datatype, value, options):
+        fails.extend(validate_step(datatype, value, options) or [])
+    walk(datatype, value, callback, mode='readonly')
+    return fails
+
+
+def walk_coerce(datatype, value):
+    """Coerced `value`, the way coercion worked before compilation."""
+    return walk(datatype, value, coerce_step, mode='copy_on_write')
+
+
+# Workloads
+
+def wide_dict():
+    datatype = dict(('field%d' % i, 'int') for i in xrange(100))
+    value = dict(('field%d' % i, i) for i in xrange(100))
+    return datatype, value
+
+
+def nested():
+    datatype = {'rows': [{'id': 'int', 'tags': ['str'],
+        'scores': [{'name': 'str', 'value': 'float'}]}]}
+    value = {'rows': [{'id': i, 'tags': ['a', 'b', 'c'],
+        'scores': [{'name': 'x', 'value': 1.5}] * 3} for i in xrange(100)]}
+    return datatype, value
+
+
+def wildcard():
+    datatype = {'_any_': {'count': 'int', 'optional label': 'str'}}
+    value = dict(('key%d' % i, {'count': i}) for i in xrange(200))
+    return datatype, value
+
+
+def tuples():
+    datatype = [['int', 'str', 'bool', 'nullable float']]
+    value = [[i, 'a', True, None] for i in xrange(200)]
+    return datatype, value
+
+
+def choices():
+    datatype = [choice('int', 'str', {'foo': 'int'}, ['bool'])]
+    value = [1, 'a', {'foo': 1}, [True]] * 50
+    return datatype, value
+
+
+def union():
+    shapes = ['shape%d' % i for i in xrange(10)]
+    datatype = [choice(*[{'kind': literal(x), 'size': 'int', 'label': 'str'}
+        for x in shapes])]
+    value = [{'kind': shapes[i % 10], 'size': i, 'label': 'x'}
+            for i in xrange(200)]
+    return datatype, value
+
+
+def tagged():
+    kinds = ['event%d' % i for i in xrange(40)]
+    datatype = [tagged_union('kind', dict((x, {'size': 'int', 'label': 'str'})
+        for x in kinds))]
+    value = [{'kind': kinds[i % 40], 'size': i, 'label': 'x'}
+            for i in xrange(200)]
+    return datatype, value
+
+
+def recursive():
+    datatype = named('tree', {'value': 'int',
+        'children': [reference('tree')]})
+
+    def tree(depth):
+        children = [tree(depth - 1) for _ in xrange(3)] if depth else []
+        return {'value': depth, 'children': children}
+    return datatype, tree(5)
+
+
+def invalid():
+    datatype, value = nested()
+    for row in value['rows'][::10]:
+        row['id'] = str(row['id'])
+        row['unexpected'] = True
+    return datatype, value
+
+
+def coercion_batch():
+    datatype = [{'id': 'int', 'price': 'float', 'name': 'str'}]
+    value = [{'id': str(i), 'price': '%d.5' % i, 'name': i}
+            for i in xrange(1000)]
+    return datatype, value
+
+
+workloads = [wide_dict, nested, wildcard, tuples, choices, union, tagged,
+        recursive, invalid]
+
+
+def register_validation(workload):
+    def validate_walk():
+        datatype, value = workload()
+        return lambda: walk_failures(datatype, value)
+
+    def validate():
+        datatype, value = workload()
+        return lambda: failures(datatype, value)
+
+    def validate_codegen():
+        datatype, value = workload()
+        validator = compile(datatype, codegen=True)
+        return lambda: validator.failures(value)
+
+    def check():
+        datatype, value = workload()
+        return lambda: is_valid(datatype, value)
+
+    for setup in [validate_walk, validate, validate_codegen, check]:
+        setup.__name__ = '%s.%s' % (workload.__name__, setup.__name__)
+        case(setup)
+
+
+for workload in workloads:
+    register_validation(workload)
+
+
+@case
+def revalidate():
+    datatype, value = nested()
+    validator = compile(datatype)
+    previous = validator.failure_details(value)
+    value['rows'][50]['scores'][1] = {'name': 'y', 'value': 'bad'}
+    changed = ['rows[50].scores[1]', 'rows[99].id']
+    return lambda: validator.revalidate(value, previous, changed)
+
+
+@case
+def revalidate_full():
+    datatype, value = nested()
+    validator = compile(datatype)
+    value['rows'][50]['scores'][1] = {'name': 'y', 'value': 'bad'}
+    return lambda: validator.failure_details(value)
+
+
+@case
+def cached_failures():
+    datatype, value = nested()
+    validator = compile(datatype)
+    results.maxsize = 16
+    return lambda: validator.failures(value)
+
+
+@case
+def decode():
+    datatype, value = nested()
+    document = json.dumps(value)
+    return lambda: decoding.decode(datatype, document)
+
+
+@case
+def decode_loads():
+    datatype, value = nested()
+    document = json.dumps(value)
+    return lambda: failures(datatype, json.loads(document))
+
+
+@case
+def decode_invalid():
+    datatype, value = nested()
+    value['rows'][1]['id'] = 'bad'
+    document = json.dumps(value)
+
+    def run():
+        try:
+            decoding.decode(datatype, document)
+        except decoding.InvalidDocumentError:
+            pass
+    return run
+
+
+@case
+def coerce_walk():
+    datatype, value = coercion_batch()
+    return lambda: walk_coerce(datatype, value)
+
+
+@case
+def coerce():
+    datatype, value = coercion_batch()
+    return lambda: coerce_value(datatype, value)
+
+
+@case
+def coerce_valid():
+    datatype, value = coercion_batch()
+    value = coerce_value(datatype, value)
+    return lambda: coerce_value(datatype, value)
+
+
+@case
+def coerce_numbers():
+    values = [str(i) for i in xrange(10000)]
+    return lambda: coerce_value(['int'], values)
+
+
+@case
+def decorated_returns():
+    datatype, value = nested()
+
+    @returns(datatype)
+    def fn():
+        return value
+    return fn
+
+
+@case
+def decorated_returns_iter():
+    datatype, value = nested()
+
+    @returns_iter(datatype['rows'][0])
+    def fn():
+        return iter(value['rows'])
+    return lambda: list(fn())
+
+
+@case
+def decorated_accepts():
+    @accepts({'name': 'str', 'count': 'int', 'options': {'_any_': 'bool'}})
+    def fn(name, count, options=None):
+        return name
+
+    options = {'verbose': True, 'dry_run': False}
+    return lambda: fn('foo', 3, options=options)
@@ -0,0 +1,134 @@
+"""Run benchmarks, optionally comparing against a saved baseline.
+
+Each case is run in a fresh process, reporting operations per second (the
+best of several rounds) and how much the process' peak memory grew while
+running it (after building its datatype and values).
+
+Usage:
+    python benchmarks/run.py [options] [case-name-prefix ...]
+
+Examples:
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --compare baseline.json nested
+"""
+
+import json
+import os
+import sys
+
+from multiprocessing import Pipe, Process
+from optparse import OptionParser
+from resource import RUSAGE_SELF, getrusage
+from timeit import default_timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from benchmarks.cases import cases
+
+
+def measure(setup, duration, rounds):
+    """Return (operations per second, peak memory growth in KiB)."""
+    fn = setup()
+    memory = getrusage(RUSAGE_SELF).ru_maxrss
+    fn()    # warm caches
+
+    # Find number of calls taking about a round's duration
+    number, elapsed = 1, 0
+    while elapsed < duration / 10.0:
+        number *= 2
+        elapsed = timed(fn, number)
+    number = max(1, int(number * duration / elapsed))
+
+    best = min(timed(fn, number) for _ in xrange(rounds))
+    memory = getrusage(RUSAGE_SELF).ru_maxrss - memory
+    return number / best, memory
+
+
+def timed(fn, number):
+    start = default_timer()
+    for _ in xrange(number):
+        fn()
+    return default_timer() - start
+
+
+def run_case(name, duration, rounds):
+    """Measure case `name` in a child process, so memory isn't shared."""
+    receiver, sender = Pipe(duplex=False)
+
+    def child():
+        sender.send(measure(cases[name], duration, rounds))
+
+    process = Process(target=child)
+    process.start()
+    sender.close()  # so a failed child ends `recv`, rather than hanging
+    try:
+        return receiver.recv()
+    except EOFError:
+        raise RuntimeError('benchmark %r failed' % name)
+    finally:
+        process.join()
+
+
+def compare(result, baseline):
+    """Return percentage change of ops/sec from `baseline`."""
+    return 100.0 * (result['ops'] - baseline['ops']) / baseline['ops']
+
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options] [case-name-prefix ...]')
+    parser.add_option('--duration', type='float', default=0.2,
+            help='seconds per round (default: %default)')
+    parser.add_option('--rounds', type='int', default=3,
+            help='rounds per case, the best is kept (default: %default)')
+    parser.add_option('--save', metavar='FILE',
+            help='save results as a baseline')
+    parser.add_option('--compare', metavar='FILE',
+            help='compare results with a saved baseline')
+    parser.add_option('--tolerance', type='float', default=10.0,
+            help='percentage slowdown from baseline reported as a '
+            'regression (default: %default)')
+    parser.add_option('--list', action='store_true', help='list cases')
+    options, prefixes = parser.parse_args(argv)
+
+    names = [name for name in cases
+            if not prefixes or any(name.startswith(x) for x in prefixes)]
+    if options.list:
+        print('\n'.join(names))
+        return 0
+
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    width = max(len(name) for name in names)
+    print('%-*s %14s %10s %9s' % (width, 'case', 'ops/sec', 'mem KiB',
+        'change'))
+    for name in names:
+        ops, memory = run_case(name, options.duration, options.rounds)
+        result = results[name] = {'ops': ops, 'memory': memory}
+
+        change = ''
+        if name in baseline:
+            percent = compare(result, baseline[name])
+            change = '%+.1f%%' % percent
+            if percent < -options.tolerance:
+                regressions.append(name)
+                change += ' !'
+        print('%-*s %14.1f %10d %9s' % (width, name, ops, memory, change))
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print('\n%d regression(s) beyond %.0f%%: %s' % (len(regressions),
+            options.tolerance, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,4 @@
 """Shortcut datatype helpers."""
 
-from datatype.language import choice, named, reference, literal
+from datatype.language import choice, named, reference, literal, tagged_union
 
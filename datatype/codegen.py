@@ -0,0 +1,336 @@
+"""Validator code generation.
+
+Turns compiled datatype nodes (see `datatype.compiler`) into specialized
+python source, which is then executed into a single validation function.
+
+Provides:
+    `generate`: Returns source and validation function for a compiled node.
+"""
+
+__all__ = ['generate']
+
+import __builtin__
+
+from collections import defaultdict
+from itertools import count
+
+from datatype.tools import Failure, tuple_length_failures
+
+
+# Dictionaries with more properties than this dispatch through a lookup
+# table of per-property functions, rather than an if/elif chain.
+max_inline_properties = 8
+
+# Containers nested deeper than this many levels of indentation are validated
+# by a function of their own, keeping within python's limits on nested blocks
+# (20) and indentation (100) in any one function.
+max_inline_depth = 16
+
+
+def generate(node):
+    """Return (source, function) validating values against `node`.
+
+    The generated function has the same signature as a node's `failures`
+    method: `function(value, path, fails)`.  Nodes the generator does not
+    know about are validated by calling back into their `failures` method.
+    Should the generated source fail to compile anyway, source is None and
+    function is `node.failures`.
+
+    Example:
+        >>> from datatype.compiler import compile
+        >>> from datatype.language import literal
+        >>> source, validate = generate(compile(literal('foo')).root)
+        >>> print(source)
+        def validate_0(value, path, fails):
+            if value is None:
+                fails.append(_Failure(path, 'null'))
+            elif 'foo' != value:
+                fails.append(_Failure(path, 'literal', 'foo', value))
+        >>> fails = []
+        >>> validate('bar', None, fails)
+        >>> [x.render() for x in fails]
+        ['expected literal value "foo", got "bar"']
+    """
+    generator = Generator()
+    entry = generator.function(node)
+    try:
+        namespace = generator.execute()
+    except SyntaxError:
+        return None, node.failures
+    return generator.source(), namespace[entry]
+
+
+class Generator(object):
+    """Accumulates generated functions and the namespace they run in."""
+
+    def __init__(self):
+        self.namespace = {
+                '_Failure': Failure,
+                '_tuple_length': tuple_length_failures,
+                'defaultdict': defaultdict,
+            }
+        self.functions = {}
+        self.blocks = []
+        self.epilogue = []
+        self.counter = count()
+
+    def name(self, prefix):
+        """Return a fresh name for use in generated source."""
+        return '%s%d' % (prefix, next(self.counter))
+
+    def const(self, obj, prefix='_c'):
+        """Make `obj` available to generated source, returning its name."""
+        name = self.name(prefix)
+        self.namespace[name] = obj
+        return name
+
+    def literal(self, obj):
+        """Return source expression evaluating to `obj`."""
+        if type(obj) in (str, unicode, int, long, bool, type(None)):
+            return repr(obj)
+        return self.const(obj)
+
+    def type_name(self, type_):
+        """Return source expression evaluating to `type_`."""
+        if getattr(__builtin__, type_.__name__, None) is type_:
+            return type_.__name__
+        return self.const(type_, '_t')
+
+    def function(self, node):
+        """Generate a function validating `node`, returning its name."""
+        key = id(node)
+        if key not in self.functions:
+            name = self.functions[key] = self.name('validate_')
+            lines = ['def %s(value, path, fails):' % name]
+            lines.extend(self.emit(node, 'value', 'path', 'fails', 1))
+            self.blocks.append('\n'.join(lines))
+        return self.functions[key]
+
+    def source(self):
+        return '\n\n'.join(self.blocks + self.epilogue)
+
+    def execute(self):
+        """Execute generated source, returning the resulting namespace."""
+        namespace = dict(self.namespace)
+        exec(compile(self.source(), '<datatype codegen>', 'exec'), namespace)
+        return namespace
+
+    def emit(self, node, value, path, fails, depth):
+        """Return source lines validating `value` against `node`.
+
+        `path` is a source expression, only evaluated on failure.
+        """
+        if depth > max_inline_depth and type(node).__name__ in nested_nodes:
+            return [indent(depth, '%s(%s, %s, %s)' % (
+                self.function(node), value, path, fails))]
+        emitter = getattr(self, 'emit_%s' % type(node).__name__,
+                self.emit_fallback)
+        return emitter(node, value, path, fails, depth)
+
+    def emit_fallback(self, node, value, path, fails, depth):
+        return [indent(depth, '%s.failures(%s, %s, %s)' % (
+            self.const(node, '_n'), value, path, fails))]
+
+    def check(self, node, value):
+        """Return source expression checking validity of `value`.
+
+        Primitives are checked inline, other nodes use their fail-fast
+        `check` method.
+        """
+        if type(node).__name__ == 'PrimitiveNode':
+            checks = ['type(%s) is %s' % (value, self.type_name(t))
+                    for t in node.types]
+            if node.nullable:
+                checks.insert(0, '%s is None' % value)
+            return '(%s)' % ' or '.join(checks)
+        return '%s.check(%s)' % (self.const(node, '_n'), value)
+
+    def failure(self, fails, path, code, expected='None', actual='None'):
+        """Return source statement appending a failure to `fails`."""
+        args = [path, repr(code), expected, actual]
+        while args[-1] == 'None':
+            args.pop()
+        return '%s.append(_Failure(%s))' % (fails, ', '.join(args))
+
+    def emit_null(self, value, path, fails, depth):
+        return [indent(depth, 'if %s is None:' % value),
+                indent(depth + 1, self.failure(fails, path, 'null'))]
+
+    def emit_AnyNode(self, node, value, path, fails, depth):
+        return self.emit_null(value, path, fails, depth)
+
+    def emit_PrimitiveNode(self, node, value, path, fails, depth):
+        mismatch = ' and '.join('type(%s) is not %s' % (
+            value, self.type_name(t)) for t in node.types)
+        check = [indent(depth + 1, self.failure(fails, path, 'type',
+            repr(node.name), 'type(%s).__name__' % value))]
+
+        if node.nullable:
+            return [indent(depth, 'if %s is not None and %s:' % (
+                value, mismatch))] + check
+        return self.emit_null(value, path, fails, depth) + [
+                indent(depth, 'elif %s:' % mismatch)] + check
+
+    def emit_LiteralNode(self, node, value, path, fails, depth):
+        literal = self.literal(node.value)
+        return self.emit_null(value, path, fails, depth) + [
+                indent(depth, 'elif %s != %s:' % (literal, value)),
+                indent(depth + 1, self.failure(fails, path, 'literal',
+                    literal, value))]
+
+    def emit_ListNode(self, node, value, path, fails, depth):
+        index, item = self.name('i'), self.name('v')
+        item_path = '(%s, %s, True)' % (path, index)
+        return self.emit_null(value, path, fails, depth) + [
+                indent(depth, 'elif isinstance(%s, list):' % value),
+                indent(depth + 1, 'for %s, %s in enumerate(%s):' % (
+                    index, item, value)),
+            ] + self.emit(node.item, item, item_path, fails, depth + 2)
+
+    def emit_TupleNode(self, node, value, path, fails, depth):
+        lines = self.emit_null(value, path, fails, depth)
+        dlen = len(node.items)
+        if not dlen:
+            return lines
+
+        lines.append(indent(depth, 'else:'))
+        depth += 1
+        length = self.name('n')
+        lines.append(indent(depth, '%s = len(%s)' % (length, value)))
+        if dlen > 1:
+            lines.extend([
+                indent(depth, 'if %s != %d:' % (length, dlen)),
+                indent(depth + 1, '_tuple_length(%s, %s, %d, %s)' % (
+                    fails, path, dlen, length)),
+            ])
+
+        lines.append(indent(depth, 'if isinstance(%s, list):' % value))
+        for i, item in enumerate(node.items):
+            var = self.name('v')
+            lines.extend([
+                indent(depth + 1, 'if %s > %d:' % (length, i)),
+                indent(depth + 2, '%s = %s[%d]' % (var, value, i)),
+            ])
+            lines.extend(self.emit(item, var, '(%s, %d, True)' % (path, i),
+                fails, depth + 2))
+        return lines
+
+    def emit_ObjectNode(self, node, value, path, fails, depth):
+        vtype, keys = self.name('t'), self.name('s')
+        lines = self.emit_null(value, path, fails, depth) + [
+                indent(depth, 'else:'),
+                indent(depth + 1, '%s = type(%s)' % (vtype, value)),
+                indent(depth + 1, 'if %s is not dict and %s is not %s:' % (
+                    vtype, vtype, 'defaultdict')),
+                indent(depth + 2, self.failure(fails, path, 'type', "'dict'",
+                    '%s.__name__' % vtype)),
+                indent(depth + 1, 'else:'),
+                indent(depth + 2, '%s = set(%s)' % (keys, value)),
+            ]
+
+        key = self.name('k')
+        if node.required_keys:
+            lines.extend([
+                indent(depth + 2, 'for %s in %s - %s:' % (
+                    key, self.const(node.required_keys, '_required'), keys)),
+                indent(depth + 3, self.failure(fails, path,
+                    'missing_property', key)),
+            ])
+        if not node.any_keys:
+            lines.extend([
+                indent(depth + 2, 'for %s in %s - %s:' % (
+                    key, keys, self.const(node.all_keys, '_all'))),
+                indent(depth + 3, self.failure(fails, path,
+                    'unexpected_property', actual=key)),
+            ])
+
+        item = self.name('v')
+        item_path = '(%s, %s, False)' % (path, key)
+        lines.extend([
+            indent(depth, 'if isinstance(%s, dict):' % value),
+            indent(depth + 1, 'for %s, %s in %s.iteritems():' % (
+                key, item, value)),
+        ])
+        depth += 2
+
+        if len(node.properties) > max_inline_properties:
+            table = self.name('_properties')
+            self.epilogue.append('%s = {%s}' % (table, ', '.join(
+                '%s: %s' % (self.literal(k), self.function(v))
+                for k, v in node.properties.iteritems())))
+            lines.append(indent(depth, '%s.get(%s, %s)(%s, %s, %s)' % (
+                table, key, self.function(node.default), item, item_path,
+                fails)))
+            return lines
+
+        cond = 'if'
+        for k, child in node.properties.iteritems():
+            lines.append(indent(depth, '%s %s == %s:' % (
+                cond, key, self.literal(k))))
+            lines.extend(self.emit(child, item, item_path, fails, depth + 1))
+            cond = 'elif'
+
+        if cond == 'if':
+            return lines + self.emit(node.default, item, item_path, fails,
+                    depth)
+        return lines + [indent(depth, 'else:')] + self.emit(
+                node.default, item, item_path, fails, depth + 1)
+
+    def emit_ChoiceNode(self, node, value, path, fails, depth):
+        # Primitive choices are checked inline, before the node's own check
+        # dispatches to any others by type (see `ChoiceNode.check`)
+        checks = [self.check(x, value) for x in node.nodes
+                if type(x).__name__ == 'PrimitiveNode']
+        if len(checks) < len(node.nodes):
+            checks.append(self.check(node, value))
+        valid = ' or '.join(checks)
+        return self.emit_null(value, path, fails, depth) + [
+                indent(depth, 'elif not (%s):' % (valid or 'False')),
+                indent(depth + 1, self.failure(fails, path, 'choice',
+                    self.const(node.choice, '_choice'), value)),
+            ]
+
+    def emit_TaggedUnionNode(self, node, value, path, fails, depth):
+        vtype, variant = self.name('t'), self.name('f')
+        tag = self.literal(node.tag)
+        table = self.name('_variants')
+        self.epilogue.append('%s = {%s}' % (table, ', '.join(
+            '%s: %s' % (self.literal(k), self.function(v))
+            for k, v in node.variants.iteritems())))
+
+        return self.emit_null(value, path, fails, depth) + [
+                indent(depth, 'else:'),
+                indent(depth + 1, '%s = type(%s)' % (vtype, value)),
+                indent(depth + 1, 'if %s is not dict and %s is not %s:' % (
+                    vtype, vtype, 'defaultdict')),
+                indent(depth + 2, self.failure(fails, path, 'type', "'dict'",
+                    '%s.__name__' % vtype)),
+                indent(depth + 1, 'elif %s not in %s:' % (tag, value)),
+                indent(depth + 2, self.failure(fails, path,
+                    'missing_property', tag)),
+                indent(depth + 1, 'else:'),
+                indent(depth + 2, 'try:'),
+                indent(depth + 3, '%s = %s.get(%s[%s])' % (
+                    variant, table, value, tag)),
+                indent(depth + 2, 'except TypeError:'),
+                indent(depth + 3, '%s = None' % variant),
+                indent(depth + 2, 'if %s is None:' % variant),
+                indent(depth + 3, self.failure(fails,
+                    '(%s, %s, False)' % (path, tag), 'unknown_tag',
+                    self.const(node.tags, '_tags'), '%s[%s]' % (value, tag))),
+                indent(depth + 2, 'else:'),
+                indent(depth + 3, '%s(%s, %s, %s)' % (
+                    variant, value, path, fails)),
+            ]
+
+    def emit_ReferenceNode(self, node, value, path, fails, depth):
+        return [indent(depth, '%s(%s, %s, %s)' % (
+            self.function(node.target), value, path, fails))]
+
+
+# Nodes whose validation nests blocks within the source validating them
+nested_nodes = frozenset(['ListNode', 'TupleNode', 'ObjectNode'])
+
+
+def indent(depth, line):
+    return '    ' * depth + line
@@ -2,23 +2,26 @@
 
 Provides:
     `coerce_value`: Returns best attempt at coercing value to given type.
+    `coerce_array`: Returns list of numbers coerced into an `array.array`.
 """
 
-__all__ = ['coerce_value']
+__all__ = ['coerce_array', 'coerce_value']
 
-from datatype.tools import Choice, NewValue, walk
-from datatype.validation import primitives
+from array import array
 
+from datatype.compiler import ListNode, PrimitiveNode, cached_compile
+from datatype.language import coercable_types, coerce_to
+from datatype.tools import Choice, NewValue
 
-coercable_types = reduce(list.__add__,
-        (list(x) for x in primitives.itervalues()))
 
-coerce_to = dict((k, v[0]) for k, v in primitives.iteritems())
-
-
-def coerce_value(datatype, value):
+def coerce_value(datatype, value, inplace=False):
     """Attempt to coerce value to requested datatype.
 
+    Optional Arguments:
+        inplace: if true, lists and dictionaries containing a coerced value
+        are updated in place rather than copied, so `value` itself is
+        returned (unless it is itself coerced)
+
     Example:
         >>> coerce_value("int", "5")
         5
@@ -28,8 +31,58 @@ def coerce_value(datatype, value):
     Example:
         >>> coerce_value(['int'], ['1', '2', 'c'])
         [1, 2, 'c']
+
+    Lists and dictionaries are only copied when some value within them was
+    coerced; otherwise they are returned as given.  Lists of primitives (eg.
+    ['int']) are converted in bulk.
+
+    Example:
+        >>> value = {'foo': ['1', 2]}
+        >>> coerce_value({'foo': ['int']}, value, inplace=True) is value
+        True
+        >>> value
+        {'foo': [1, 2]}
+    """
+    return cached_compile(datatype).coerce(value, inplace)
+
+
+def coerce_array(datatype, values, typecode=None):
+    """Coerce `values` to list `datatype` of ints or floats, returning an
+    `array.array` of the result.
+
+    Optional Arguments:
+        typecode: array typecode, 'l' (for ints) or 'd' (for floats) by
+        default
+
+    Example:
+        >>> coerce_array(['float'], ['1.5', 2, 3.0])
+        array('d', [1.5, 2.0, 3.0])
+
+    Raises ValueError if some value can't be coerced, or doesn't fit the
+    typecode.
     """
-    return walk(datatype, value, coerce_step)
+    root = cached_compile(datatype).root
+    if not (isinstance(root, ListNode) and
+            isinstance(root.item, PrimitiveNode) and
+            root.item.name in array_typecodes and not root.item.nullable):
+        raise ValueError('array coercion requires a list of ints or floats '
+                'datatype, got %r' % (datatype,))
+
+    typecode = typecode or array_typecodes[root.item.name]
+    coerced = root.coerce(values, 'copy_on_write')
+    try:
+        return array(typecode, coerced)
+    except (TypeError, OverflowError):
+        bad = [x for x in coerced if type(x) not in root.item.types]
+        if bad:
+            raise ValueError('cannot coerce %r to %s' % (
+                bad[0], root.item.name))
+        raise ValueError('%s values do not fit array typecode %r' % (
+            root.item.name, typecode))
+
+
+# Default array typecodes of primitives
+array_typecodes = {'int': 'l', 'float': 'd'}
 
 
 def coerce_step(_, datatype, value, __):
@@ -0,0 +1,1170 @@
+"""Compiled datatypes.
+
+Provides:
+    `compile`: Analyse a datatype once, returning a reusable `Validator`.
+    `cached_compile`: As `compile`, reusing validators of recent datatypes.
+    `clear_cache`: Empties the `cached_compile` cache.
+    `to_node`: Returns the compiled node form of a datatype.
+    `to_datatype`: Returns the datatype of a compiled node.
+"""
+
+__all__ = ['compile', 'cached_compile', 'clear_cache', 'to_datatype',
+        'to_node', 'Validator']
+
+from cPickle import PicklingError, dumps
+from collections import OrderedDict, defaultdict
+from copy import deepcopy
+from hashlib import sha1
+from itertools import chain, count, imap, islice, izip
+from multiprocessing import Pool
+from operator import is_not
+from threading import Lock
+from time import time
+
+from datatype.codegen import generate
+from datatype.language import (choice, coercable_types, coerce_to, literal,
+        named, primitives, reference, tagged_union, typename)
+from datatype.profiling import hooks, profiled
+from datatype.tools import (Choice, Failure, Index, dict_datatypes,
+        extract_named_types, fingerprint, parse_path, parse_primitive,
+        rebuild, select_variant, tagged_variant, tuple_length_failures,
+        unknown_tag)
+
+
+def compile(datatype, codegen=False):
+    """Analyse `datatype` once and return a reusable `Validator`.
+
+    Optional Arguments:
+        codegen: if true, validation is done by a python function generated
+        specifically for this datatype (see `datatype.codegen`).  The
+        generated source is available as the validator's `source`.
+
+    Example:
+        >>> validator = compile({'foo': 'int'})
+        >>> validator.failures({'foo': 'bar'})
+        ['foo: expected int, got str']
+        >>> validator.coerce({'foo': '5'})
+        {'foo': 5}
+    """
+    return Validator(datatype, codegen)
+
+
+class Validator(object):
+    """Pre-analysed datatype, ready to validate or coerce many values.
+
+    Failures match those of `datatype.validation.failures` exactly, and
+    coerced values match `datatype.coercion.coerce_value`.
+    """
+
+    def __init__(self, datatype, codegen=False):
+        # A copy, as validators are shared by all datatypes of the same
+        # structure (see `ValidatorCache`), which may be mutated later
+        self.datatype = deepcopy(datatype)
+        self.root = to_node(self.datatype)
+
+        if codegen:
+            self.source, self._failures = generate(self.root)
+        else:
+            self.source, self._failures = None, self.root.failures
+
+    def failures(self, value, cached=True):
+        """Return list of failures (if any) validating `value`.
+
+        Optional Arguments:
+            cached: if false, `value` is validated even if its failures are
+            in the result cache (see `ResultCache`)
+        """
+        if cached and results.maxsize > 0:
+            return results.failures(self, value)
+        return [x.render() for x in self.failure_details(value)]
+
+    def failure_details(self, value):
+        """Return list of `datatype.tools.Failure` (if any) validating
+        `value`.
+
+        Example:
+            >>> fails = compile({'foo': 'int'}).failure_details({'bar': 1})
+            >>> [(x.code, x.path) for x in fails]
+            [('missing_property', ()), ('unexpected_property', ())]
+            >>> fails[0].expected, fails[1].actual
+            ('foo', 'bar')
+        """
+        if hooks:
+            return profiled(self, 'failures', self._failure_details, value)
+        return self._failure_details(value)
+
+    def _failure_details(self, value):
+        # Nodes build failure locations for every value they visit, so valid
+        # values are checked (failing fast) first.  Generated functions only
+        # build locations on failure, and are faster than checking.
+        if self.source is None and self.root.check(value):
+            return []
+        fails = []
+        self._failures(value, None, fails)
+        return fails
+
+    def is_valid(self, value):
+        """Return boolean representing validity of `value`.
+
+        Stops at the first failure found, without building failure messages.
+        """
+        if hooks:
+            return profiled(self, 'is_valid', self.root.check, value)
+        return self.root.check(value)
+
+    def failures_many(self, values, limit=None, workers=None):
+        """Return dictionary of record index -> failures, for each invalid
+        record in `values`.
+
+        Optional Arguments:
+            limit: stop validating after this many invalid records
+            workers: number of processes to validate with.  Batches of less
+            than `parallel_threshold` records are validated in-process.
+
+        Example:
+            >>> compile({'foo': 'int'}).failures_many(
+            ...     [{'foo': 1}, {'foo': 'a'}, {'foo': 2}])
+            {1: ['foo: expected int, got str']}
+        """
+        if workers > 1:
+            values = iter(values)
+            head = list(islice(values, parallel_threshold))
+            if len(head) == parallel_threshold:
+                return self._failures_parallel(
+                        chain(head, values), limit, workers)
+            values = head
+        return self._failures_serial(values, limit)
+
+    def _failures_serial(self, values, limit, start=0):
+        check, fails_of = self.root.check, self._failures
+        bad = {}
+        for i, value in enumerate(values, start):
+            # Only invalid records pay for building failure messages
+            if check(value):
+                continue
+
+            fails = []
+            fails_of(value, None, fails)
+            bad[i] = [x.render() for x in fails]
+            if limit is not None and len(bad) >= limit:
+                break
+        return bad
+
+    def _failures_parallel(self, values, limit, workers):
+        chunks = ((start, chunk, limit) for start, chunk in enumerate_chunks(
+            values, parallel_chunk_size))
+        pool = Pool(workers, init_worker, (self,))
+        try:
+            # Chunks are returned in order, so failures are too
+            bad = {}
+            for chunk_bad in pool.imap(validate_chunk, chunks):
+                for i in sorted(chunk_bad):
+                    bad[i] = chunk_bad[i]
+                    if limit is not None and len(bad) >= limit:
+                        return bad
+            return bad
+        finally:
+            pool.terminate()
+
+    def coerce(self, value, inplace=False):
+        """Return best attempt at coercing `value`.
+
+        Lists and dictionaries are only copied when some value within them
+        was coerced.
+
+        Optional Arguments:
+            inplace: if true, lists and dictionaries are updated in place
+            (rather than copied) where a value within them was coerced
+        """
+        mode = 'inplace' if inplace else 'copy_on_write'
+        if hooks:
+            return profiled(self, 'coerce',
+                    lambda value: self.root.coerce(value, mode), value)
+        return self.root.coerce(value, mode)
+
+    def revalidate(self, value, previous, changed):
+        """Return list of `datatype.tools.Failure` validating `value`, given
+        failures `previous` of it before values at paths `changed` were
+        updated.
+
+        Paths are formatted as 'foo[0].bar' (or given as tuples, like
+        `Failure.path`), and may be of added or removed dictionary keys.
+        Only the values at changed paths are validated again, along with the
+        keys of the dictionaries (and lengths of the tuples) containing them.
+        Where a path can't be followed (eg. into a choice, or a list index
+        that no longer exists) the value it stops at is validated in full,
+        so an item removed from the middle of a list should be given as a
+        change to the list itself.
+
+        Failures are the same as `failure_details` gives for the updated
+        value, though not necessarily in the same order.
+
+        Example:
+            >>> validator = compile({'foo': ['int'], 'bar': 'str'})
+            >>> value = {'foo': [1, 'a']}
+            >>> fails = validator.failure_details(value)
+            >>> value['foo'][1] = 2
+            >>> value['baz'] = 3
+            >>> fails = validator.revalidate(value, fails, ['foo[1]', 'baz'])
+            >>> sorted(x.render() for x in fails)
+            ['missing required property: "bar"', 'unexpected property "baz"']
+        """
+        targets, containers = {}, {}
+        for path in changed:
+            if isinstance(path, basestring):
+                path = parse_path(path)
+            path, target, within = locate(self.root, value, tuple(path))
+            targets[path] = target
+            containers.update(within)
+
+        # Values within other changed values are validated along with them
+        def stale(path, length):
+            return any(path[:i] in targets for i in xrange(length))
+        targets = dict((k, v) for k, v in targets.iteritems()
+                if not stale(k, len(k)))
+        containers = dict((k, v) for k, v in containers.iteritems()
+                if not stale(k, len(k) + 1))
+
+        fails = []
+        for fail in previous:
+            path = fail.path
+            if not (stale(path, len(path) + 1) or
+                    path in containers and fail.code in key_failure_codes):
+                fails.append(fail)
+        for node, v, location in targets.itervalues():
+            if node is not None:
+                node.failures(v, location, fails)
+        for node, v, location in containers.itervalues():
+            node.key_failures(v, location, fails)
+        return fails
+
+    def __repr__(self):
+        return '<Validator of %r>' % (self.datatype,)
+
+    def __getstate__(self):
+        # Generated functions can't be pickled, so are regenerated
+        state = dict(self.__dict__)
+        del state['_failures']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.source is None:
+            self._failures = self.root.failures
+        else:
+            self.source, self._failures = generate(self.root)
+
+
+# Batches of at least this many records are split into chunks of
+# `parallel_chunk_size` when validated by multiple processes.
+parallel_threshold = 10000
+parallel_chunk_size = 1000
+
+# Validator used by a worker process, set by `init_worker`.
+worker_validator = None
+
+
+def init_worker(validator):
+    global worker_validator
+    worker_validator = validator
+
+
+def validate_chunk(args):
+    start, values, limit = args
+    return worker_validator._failures_serial(values, limit, start)
+
+
+def locate(node, value, path):
+    """Follow `path` from `node` and its `value` as far as it can be
+    followed, for `Validator.revalidate`.
+
+    Returns (path followed, (node, value, location) at its end,
+    {path: (node, value, location)} of the containers it passes through).
+    The node at the end is None if the path ends at a missing dictionary
+    key.
+    """
+    location, containers = None, {}
+    for depth, key in enumerate(path):
+        # Tagged unions are followed into the variant their tag selects,
+        # unless the tag itself has changed
+        while True:
+            if isinstance(node, ReferenceNode):
+                node = node.target
+            elif isinstance(node, TaggedUnionNode) and key != node.tag:
+                tag_value = select_variant(node.variants, value, node.tag)
+                if tag_value is unknown_tag:
+                    break
+                node = node.variants[tag_value]
+            else:
+                break
+
+        child = node.child(value, key)
+        if child is None:
+            return path[:depth], (node, value, location), containers
+
+        is_object = isinstance(node, ObjectNode)
+        containers[path[:depth]] = (node, value, location)
+        location = (location, key, not is_object)
+        if is_object and key not in value:
+            return path[:depth + 1], (None, None, location), containers
+        node, value = child, value[key]
+    return path, (node, value, location), containers
+
+
+# Failures `key_failures` may give
+key_failure_codes = frozenset(['missing_property', 'unexpected_property',
+    'missing_value', 'unexpected_value'])
+
+
+def enumerate_chunks(values, size):
+    """Yield (start index, list of values) for chunks of `values`."""
+    values = iter(values)
+    for start in count(0, size):
+        chunk = list(islice(values, size))
+        if not chunk:
+            return
+        yield start, chunk
+
+
+class ValidatorCache(object):
+    """Bounded, least-recently-used cache of compiled datatypes.
+
+    Datatypes are looked up by structure, so datatypes built afresh for each
+    call share a validator, and a datatype mutated in place is recompiled
+    rather than served a stale validator.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self.validators = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, datatype, codegen=False):
+        """Return (possibly cached) `Validator` of `datatype`."""
+        key = (codegen, fingerprint(datatype))
+        with self.lock:
+            validator = self.validators.pop(key, None)
+            if validator is not None:
+                self.hits += 1
+                self.validators[key] = validator
+                return validator
+            self.misses += 1
+
+        validator = Validator(datatype, codegen)
+        with self.lock:
+            self.validators[key] = validator
+            while len(self.validators) > max(self.maxsize, 0):
+                self.validators.popitem(last=False)
+        return validator
+
+    def clear(self):
+        """Remove all cached validators and reset hit/miss counters."""
+        with self.lock:
+            self.validators.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.validators)
+
+    def __repr__(self):
+        return '<ValidatorCache hits=%d misses=%d size=%d/%d>' % (
+                self.hits, self.misses, len(self), self.maxsize)
+
+
+class ResultCache(object):
+    """Bounded, least-recently-used cache of the failures of recently
+    validated values, for payloads validated over and over again.
+
+    Values are looked up by a fingerprint of their contents (see
+    `value_fingerprint`), taken every time they are validated, so values
+    mutated since are validated again rather than served stale failures.
+    Values that can't be fingerprinted are always validated.
+
+    Optional Arguments:
+        maxsize: most failure lists kept.  0 disables the cache.
+        ttl: seconds failures are kept for, or None to keep them until
+        evicted
+    """
+
+    def __init__(self, maxsize=0, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self.results = OrderedDict()
+        self.lock = Lock()
+
+    def failures(self, validator, value):
+        """Return (possibly cached) failures of `value` against
+        `validator`."""
+        fingerprint = value_fingerprint(value)
+        if fingerprint is None:
+            with self.lock:
+                self.misses += 1
+            return validator.failures(value, cached=False)
+
+        # Entries hold their validator, so its id isn't reused while cached
+        key, now = (id(validator), fingerprint), time()
+        with self.lock:
+            entry = self.results.pop(key, None)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self.hits += 1
+                self.results[key] = entry
+                return list(entry[2])
+            self.misses += 1
+
+        fails = validator.failures(value, cached=False)
+        expires = None if self.ttl is None else now + self.ttl
+        with self.lock:
+            self.results[key] = (validator, expires, tuple(fails))
+            while len(self.results) > max(self.maxsize, 0):
+                self.results.popitem(last=False)
+        return fails
+
+    def clear(self):
+        """Remove all cached failures and reset hit/miss counters."""
+        with self.lock:
+            self.results.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return '<ResultCache hits=%d misses=%d size=%d/%d>' % (
+                self.hits, self.misses, len(self), self.maxsize)
+
+
+def value_fingerprint(value):
+    """Return digest identifying `value`'s contents and their exact types,
+    or None if it can't be fingerprinted.
+
+    Values are pickled, which is several times faster than validating them
+    and tells apart values (eg. 1, 1.0 and True) that validate differently.
+    Only a digest of the pickle is kept, so cached entries stay small however
+    large the values validated.
+    """
+    try:
+        return sha1(dumps(value, 2)).digest()
+    except (PicklingError, TypeError, RuntimeError):
+        return None
+
+
+# Cache used by `cached_compile` (and so the functional validation and
+# coercion api).  Size is configurable through its `maxsize` attribute.
+cache = ValidatorCache()
+
+# Cache used by `Validator.failures` (and so `datatype.validation.failures`),
+# disabled until given a `maxsize`.
+results = ResultCache()
+
+
+def cached_compile(datatype, codegen=False):
+    """Return `Validator` for `datatype`, reusing one compiled recently.
+
+    Example:
+        >>> cached_compile(['int']) is cached_compile(['int'])
+        True
+        >>> cached_compile(['int']) is cached_compile(['str'])
+        False
+    """
+    return cache.get(datatype, codegen)
+
+
+def clear_cache():
+    """Empty the `cached_compile` cache."""
+    cache.clear()
+
+
+def to_node(datatype):
+    """Return the compiled node form of `datatype`.
+
+    Nodes are slotted objects, with primitive nodes shared between all
+    datatypes.  References are linked to the nodes they refer to.
+
+    Example:
+        >>> node = to_node({'foo': 'int', 'optional bar': ['nullable int']})
+        >>> node
+        <ObjectNode of bar, foo>
+        >>> node.properties['foo'] is to_node('int')
+        True
+        >>> node.required_keys, node.optional_keys
+        (frozenset(['foo']), frozenset(['bar']))
+    """
+    named_types, datatype = extract_named_types(datatype)
+    named = NamedNodes(named_types)
+    node = build_node(datatype, named)
+    named.resolve()
+    return node
+
+
+def to_datatype(node):
+    """Return a datatype equivalent to compiled `node`.
+
+    Example:
+        >>> to_datatype(to_node([{'foo': 'nullable int'}]))
+        [{'foo': 'nullable int'}]
+    """
+    names = dict((id(x.target), x.name) for x in iter_nodes(node)
+            if isinstance(x, ReferenceNode) and
+                not isinstance(x.target, (AnyNode, PrimitiveNode)))
+    return node_datatype(node, names, set())
+
+
+def node_datatype(node, names, defined):
+    """As `to_datatype`.  `names` maps ids of referenced nodes to their
+    names, and `defined` is the names already defined."""
+    name = names.get(id(node))
+    if name is not None and name not in defined:
+        defined.add(name)
+        return named(name, unnamed_datatype(node, names, defined))
+
+    if isinstance(node, ReferenceNode):
+        if node.name in defined:
+            return reference(node.name)
+        defined.add(node.name)
+        return named(node.name,
+                unnamed_datatype(node.target, names, defined))
+    return unnamed_datatype(node, names, defined)
+
+
+def unnamed_datatype(node, names, defined):
+    to = lambda x: node_datatype(x, names, defined)
+    if isinstance(node, PrimitiveNode):
+        return 'nullable %s' % node.name if node.nullable else node.name
+    elif isinstance(node, ListNode):
+        return [to(node.item)]
+    elif isinstance(node, TupleNode):
+        return [to(x) for x in node.items]
+    elif isinstance(node, ObjectNode):
+        return dict((k, to(node.property_of(k))) for k in node.declared_keys)
+    elif isinstance(node, ChoiceNode):
+        return choice(*[to(x) for x in node.nodes])
+    elif isinstance(node, TaggedUnionNode):
+        return tagged_union(node.tag, dict((k, to(v))
+            for k, v in node.variants.iteritems()))
+    elif isinstance(node, LiteralNode):
+        return literal(node.value)
+    return None
+
+
+def iter_nodes(node):
+    """Yield each node reachable from `node`, once."""
+    seen, stack = set(), [node]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+
+        if isinstance(node, ListNode):
+            stack.append(node.item)
+        elif isinstance(node, TupleNode):
+            stack.extend(node.items)
+        elif isinstance(node, ObjectNode):
+            stack.append(node.default)
+            stack.extend(node.properties.itervalues())
+        elif isinstance(node, ChoiceNode):
+            stack.extend(node.nodes)
+        elif isinstance(node, TaggedUnionNode):
+            stack.extend(node.variants.itervalues())
+        elif isinstance(node, ReferenceNode):
+            stack.append(node.target)
+
+
+class NamedNodes(dict):
+    """Compiled named types, built on first reference or definition."""
+
+    def __init__(self, named_types):
+        super(NamedNodes, self).__init__()
+        self.named_types = named_types
+        self.references = []
+
+        # Named lists and dictionaries are also found where they are defined
+        # within the datatype, so they are only built once
+        self.definitions = dict((id(v), k) for k, v in named_types.iteritems()
+                if isinstance(v, (dict, list)))
+
+    def __missing__(self, name):
+        node = self[name] = build_node(self.named_types[name], self)
+        return node
+
+    def resolve(self):
+        """Link references made while building nodes to their named types.
+
+        Once resolved, recursive datatypes are cycles in the node graph and
+        nothing is looked up by name while validating.
+        """
+        while self.references:
+            reference = self.references.pop()
+            reference.target = self[reference.name]
+
+
+def build_node(datatype, named):
+    """Return the compiled node for (already name-extracted) `datatype`."""
+    name = named.definitions.get(id(datatype))
+    if name is not None:
+        if name not in named:
+            named[name] = build_unnamed_node(datatype, named)
+        return named[name]
+    return build_unnamed_node(datatype, named)
+
+
+def build_unnamed_node(datatype, named):
+    options = []
+    if isinstance(datatype, str):
+        datatype, options = parse_primitive(datatype)
+
+    dt_type = typename(datatype)
+    if dt_type == 'choice':
+        return ChoiceNode(datatype.get('choices'), named)
+    elif dt_type == 'reference':
+        reference = ReferenceNode(datatype['name'])
+        named.references.append(reference)
+        return reference
+    elif dt_type == 'literal':
+        return LiteralNode(datatype.get('value'))
+    elif dt_type == 'tagged_union':
+        return TaggedUnionNode(datatype['tag'], datatype['variants'], named)
+
+    if isinstance(datatype, str):
+        return primitive_node(datatype, 'nullable' in options)
+    elif isinstance(datatype, list):
+        if len(datatype) == 1:
+            return ListNode(build_node(datatype[0], named))
+        return TupleNode(tuple(build_node(x, named) for x in datatype))
+    elif isinstance(datatype, dict):
+        return ObjectNode(datatype, named)
+    else:
+        return any_node
+
+
+class Node(object):
+    """Base of compiled nodes.
+
+    Nodes are slotted, to keep the many nodes of many datatypes small, so
+    pickle their slots explicitly.
+    """
+
+    __slots__ = ()
+
+    def __getstate__(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __setstate__(self, state):
+        for k, v in state.iteritems():
+            setattr(self, k, v)
+
+    def child(self, value, key):
+        """Return node of `value[key]`, or None if it can't be validated
+        apart from `value`."""
+        return None
+
+    def key_failures(self, value, path, fails):
+        """Add failures of the keys (or length) of container `value` alone,
+        where `child` gave a node for one of its values."""
+
+
+class AnyNode(Node):
+    """Datatype-less node (eg. a dictionary key that isn't defined)."""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return 'any_node'
+
+    def failures(self, value, path, fails):
+        if value is None:
+            fails.append(Failure(path, 'null'))
+
+    def check(self, value):
+        return value is not None
+
+    def coerce(self, value, mode):
+        return value
+
+
+class PrimitiveNode(Node):
+    """Node for primitive types, such as 'int' or 'nullable str'.
+
+    Shared between datatypes, so should be created with `primitive_node`.
+    """
+
+    __slots__ = ('name', 'nullable', 'types')
+
+    def __init__(self, name, nullable):
+        self.name = name
+        self.nullable = nullable
+        self.types = primitives[name]
+
+    def __reduce__(self):
+        return (primitive_node, (self.name, self.nullable))
+
+    def coerce_many(self, values, mode):
+        """Return list of `values` coerced (or `values` itself, if none were
+        or `mode` is 'inplace').
+
+        Values are converted in bulk, a chunk at a time.  Values that can't
+        be converted (eg. None) are left as they are, and bulk conversion
+        resumes after them.
+        """
+        convert = coerce_to[self.name]
+        coerced = values if mode == 'inplace' else []
+        for start in xrange(0, len(values), coerce_chunk_size):
+            chunk = values[start:start + coerce_chunk_size]
+            types = map(type, chunk)
+            converted = []
+            if coercable_types.issuperset(types):
+                convert_run(convert, chunk, converted)
+            else:
+                # Convert the runs of values between incoercible types
+                run = 0
+                for i, vtype in enumerate(types):
+                    if vtype not in coercable_types:
+                        convert_run(convert, chunk[run:i], converted)
+                        converted.append(chunk[i])
+                        run = i + 1
+                convert_run(convert, chunk[run:], converted)
+
+            if coerced is values:
+                values[start:start + coerce_chunk_size] = converted
+            else:
+                coerced.extend(converted)
+
+        if any(imap(is_not, coerced, values)):
+            return coerced
+        return values
+
+    def failures(self, value, path, fails):
+        if value is None:
+            if not self.nullable:
+                fails.append(Failure(path, 'null'))
+        elif type(value) not in self.types:
+            fails.append(Failure(path, 'type', self.name,
+                type(value).__name__))
+
+    def check(self, value):
+        if value is None:
+            return self.nullable
+        return type(value) in self.types
+
+    def coerce(self, value, mode):
+        if type(value) in coercable_types:
+            try:
+                return coerce_to[self.name](value)
+            except (TypeError, ValueError):
+                pass
+        return value
+
+
+class ListNode(Node):
+    """Node for homogeneous lists."""
+
+    __slots__ = ('item',)
+
+    def __init__(self, item):
+        self.item = item
+
+    def failures(self, value, path, fails):
+        if value is None:
+            fails.append(Failure(path, 'null'))
+        elif isinstance(value, list):
+            item = self.item
+            for i, v in enumerate(value):
+                item.failures(v, (path, i, True), fails)
+
+    def check(self, value):
+        if value is None:
+            return False
+        elif isinstance(value, list):
+            check = self.item.check
+            for v in value:
+                if not check(v):
+                    return False
+        return True
+
+    def child(self, value, key):
+        if isinstance(value, list) and is_index(key, len(value)):
+            return self.item
+
+    def coerce(self, value, mode):
+        if isinstance(value, list):
+            if type(self.item) is PrimitiveNode:
+                return self.item.coerce_many(value, mode)
+            coerce = self.item.coerce
+            return rebuild(value, mode,
+                    ((i, v, coerce(v, mode)) for i, v in enumerate(value)))
+        return value
+
+
+class TupleNode(Node):
+    """Node for fixed-width, heterogeneous lists."""
+
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+    def failures(self, value, path, fails):
+        if value is None:
+            fails.append(Failure(path, 'null'))
+            return
+
+        dlen = len(self.items)
+        if dlen > 1:
+            vlen = len(value)
+            if dlen != vlen:
+                tuple_length_failures(fails, path, dlen, vlen)
+
+        if dlen and isinstance(value, list):
+            for i, item, v in zip(xrange(dlen), self.items, value):
+                item.failures(v, (path, i, True), fails)
+
+    def check(self, value):
+        if value is None:
+            return False
+
+        dlen = len(self.items)
+        if dlen > 1 and dlen != len(value):
+            return False
+
+        if dlen and isinstance(value, list):
+            for item, v in zip(self.items, value):
+                if not item.check(v):
+                    return False
+        return True
+
+    def child(self, value, key):
+        if isinstance(value, list) and is_index(key, min(
+                len(self.items), len(value))):
+            return self.items[key]
+
+    def key_failures(self, value, path, fails):
+        dlen, vlen = len(self.items), len(value)
+        if dlen > 1 and dlen != vlen:
+            tuple_length_failures(fails, path, dlen, vlen)
+
+    def coerce(self, value, mode):
+        if self.items and isinstance(value, list):
+            return rebuild(value, mode, ((i, v, item.coerce(v, mode))
+                for i, item, v in izip(count(), self.items, value)))
+        return value
+
+
+class ObjectNode(Node):
+    """Node for objects (dictionaries)."""
+
+    __slots__ = ('declared_keys', 'required_keys', 'optional_keys',
+            'all_keys', 'any_keys', 'default', 'properties')
+
+    def __init__(self, datatype, named):
+        optional = lambda x: x.startswith('optional ')
+        self.declared_keys = tuple(datatype)
+        self.required_keys = frozenset(k for k in datatype
+                if not (optional(k) or k == '_any_'))
+        self.optional_keys = frozenset(k.replace('optional ', '', 1)
+                for k in datatype if optional(k))
+        self.all_keys = self.required_keys | self.optional_keys | (
+                frozenset(['_any_']) & frozenset(datatype))
+        self.any_keys = '_any_' in datatype
+
+        key_dts = dict_datatypes(datatype)
+        self.default = build_node(key_dts.default_factory(), named)
+        self.properties = dict((k, build_node(v, named))
+                for k, v in key_dts.iteritems())
+
+    def failures(self, value, path, fails):
+        vtype = type(value)
+        if vtype is type(None):
+            fails.append(Failure(path, 'null'))
+        elif vtype not in (defaultdict, dict):
+            fails.append(Failure(path, 'type', 'dict', vtype.__name__))
+        else:
+            self.key_failures(value, path, fails)
+
+        if isinstance(value, dict):
+            properties, default = self.properties, self.default
+            for k, v in value.iteritems():
+                properties.get(k, default).failures(v, (path, k, False), fails)
+
+    def check(self, value):
+        if type(value) not in (defaultdict, dict):
+            return False
+
+        for k in self.required_keys:
+            if k not in value:
+                return False
+
+        properties, default = self.properties, self.default
+        all_keys, any_keys = self.all_keys, self.any_keys
+        for k, v in value.iteritems():
+            if not (any_keys or k in all_keys):
+                return False
+            if not properties.get(k, default).check(v):
+                return False
+        return True
+
+    def child(self, value, key):
+        if type(value) in (defaultdict, dict):
+            return self.properties.get(key, self.default)
+
+    def key_failures(self, value, path, fails):
+        for k in self.required_keys - set(value):
+            fails.append(Failure(path, 'missing_property', k))
+        if not self.any_keys:
+            for k in set(value) - self.all_keys:
+                fails.append(Failure(path, 'unexpected_property', None, k))
+
+    def coerce(self, value, mode):
+        if isinstance(value, dict):
+            properties, default = self.properties, self.default
+            return rebuild(value, mode,
+                    ((k, v, properties.get(k, default).coerce(v, mode))
+                        for k, v in value.iteritems()))
+        return value
+
+    def property_of(self, key):
+        """Return node of `key`, as declared in the datatype."""
+        return self.properties.get(key, self.properties.get(
+            key.replace('optional ', '', 1)))
+
+    def __repr__(self):
+        return '<ObjectNode of %s>' % ', '.join(sorted(self.all_keys))
+
+
+class ChoiceNode(Node):
+    """Node for a choice between multiple datatypes.
+
+    Only choices that could accept the type of a value are checked.  Where
+    every dictionary choice requires a literal-valued key (a discriminator,
+    eg. {'kind': literal('circle'), ...}), dictionaries are only checked
+    against choices whose literal matches.
+    """
+
+    __slots__ = ('choice', 'nodes', 'coercions', 'discriminator', 'variants',
+            'dispatch')
+
+    def __init__(self, choices, named):
+        self.choice = Choice(choices)
+        self.nodes = tuple(build_node(x, named) for x in choices)
+
+        # Coercion only considers choices that are plain primitives
+        self.coercions = tuple(node for x, node in zip(choices, self.nodes)
+                if isinstance(x, str) and isinstance(node, PrimitiveNode))
+
+        self.discriminator, self.variants = find_discriminator(self.nodes)
+        self.dispatch = {}  # type -> nodes to check, filled as types are seen
+
+    def failures(self, value, path, fails):
+        if value is None:
+            fails.append(Failure(path, 'null'))
+        elif not self.check(value):
+            fails.append(Failure(path, 'choice', self.choice, value))
+
+    def check(self, value):
+        if value is None:
+            return False
+
+        vtype = type(value)
+        nodes = self.dispatch.get(vtype)
+        if nodes is None:
+            nodes = self.dispatch[vtype] = self.candidates(vtype)
+        for node in nodes:
+            if node.check(value):
+                return True
+
+        if self.variants and vtype in (defaultdict, dict):
+            try:
+                nodes = self.variants.get(value.get(self.discriminator), ())
+            except TypeError:   # unhashable discriminator value
+                nodes = chain.from_iterable(self.variants.itervalues())
+            for node in nodes:
+                if node.check(value):
+                    return True
+        return False
+
+    def candidates(self, vtype):
+        """Return nodes (in order) that could accept values of `vtype`,
+        other than those found through the discriminator."""
+        discriminated = set(map(id, chain.from_iterable(
+            self.variants.itervalues())))
+        return tuple(node for node in self.nodes
+                if id(node) not in discriminated and
+                    vtype in accepted_types(node, vtype))
+
+    def coerce(self, value, mode):
+        if type(value) in coercable_types:
+            for node in self.coercions:
+                try:
+                    return coerce_to[node.name](value)
+                except (TypeError, ValueError):
+                    pass
+        return value
+
+
+def accepted_types(node, vtype):
+    """Return collection of value types `node` may accept, containing `vtype`
+    if `node` can't be ruled out by type alone."""
+    if isinstance(node, PrimitiveNode):
+        return node.types
+    elif isinstance(node, (ObjectNode, TaggedUnionNode)):
+        return (defaultdict, dict)
+    elif isinstance(node, ChoiceNode):
+        return set(chain.from_iterable(
+            accepted_types(x, vtype) for x in node.nodes))
+    return (vtype,)
+
+
+def find_discriminator(nodes):
+    """Return (key, {literal value: nodes}) for the required, literal-valued
+    dictionary key shared by all dictionary `nodes`, or (None, {})."""
+    objects = [x for x in nodes if isinstance(x, ObjectNode)]
+    if len(objects) < 2:
+        return None, {}
+
+    def literal(node, key):
+        child = node.properties.get(key)
+        if isinstance(child, LiteralNode):
+            try:
+                hash(child.value)
+                return True
+            except TypeError:
+                pass
+        return False
+
+    keys = reduce(frozenset.intersection, (x.required_keys for x in objects))
+    keys = [k for k in sorted(keys)
+            if all(literal(x, k) for x in objects)]
+    if not keys:
+        return None, {}
+
+    # Prefer the key telling the most choices apart
+    key = max(keys, key=lambda k: len(set(
+        x.properties[k].value for x in objects)))
+    variants = defaultdict(list)
+    for node in objects:
+        variants[node.properties[key].value].append(node)
+    return key, dict((k, tuple(v)) for k, v in variants.iteritems())
+
+
+class TaggedUnionNode(Node):
+    """Node for dictionaries whose tag key selects their datatype.
+
+    The tag is read once, to go straight to the matching variant.
+    """
+
+    __slots__ = ('tag', 'tags', 'variants')
+
+    def __init__(self, tag, variants, named):
+        self.tag = tag
+        self.tags = sorted(variants)
+        self.variants = dict(
+                (k, build_node(tagged_variant(tag, k, v, named.named_types),
+                    named))
+                for k, v in variants.iteritems())
+
+    def failures(self, value, path, fails):
+        vtype = type(value)
+        if vtype is type(None):
+            fails.append(Failure(path, 'null'))
+        elif vtype not in (defaultdict, dict):
+            fails.append(Failure(path, 'type', 'dict', vtype.__name__))
+        elif self.tag not in value:
+            fails.append(Failure(path, 'missing_property', self.tag))
+        else:
+            tag_value = select_variant(self.variants, value, self.tag)
+            if tag_value is unknown_tag:
+                fails.append(Failure((path, self.tag, False), 'unknown_tag',
+                    self.tags, value[self.tag]))
+            else:
+                self.variants[tag_value].failures(value, path, fails)
+
+    def check(self, value):
+        if type(value) not in (defaultdict, dict):
+            return False
+        tag_value = select_variant(self.variants, value, self.tag)
+        return (tag_value is not unknown_tag and
+                self.variants[tag_value].check(value))
+
+    def coerce(self, value, mode):
+        if isinstance(value, dict):
+            tag_value = select_variant(self.variants, value, self.tag)
+            if tag_value is not unknown_tag:
+                return self.variants[tag_value].coerce(value, mode)
+        return value
+
+
+class LiteralNode(Node):
+    """Node for literal values."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def failures(self, value, path, fails):
+        if value is None:
+            fails.append(Failure(path, 'null'))
+        elif self.value != value:
+            fails.append(Failure(path, 'literal', self.value, value))
+
+    def check(self, value):
+        return value is not None and not self.value != value
+
+    def coerce(self, value, mode):
+        return value
+
+
+class ReferenceNode(Node):
+    """Node referring to a named type, linked to it once resolved."""
+
+    __slots__ = ('name', 'target')
+
+    def __init__(self, name):
+        self.name = name
+        self.target = None
+
+    def failures(self, value, path, fails):
+        self.target.failures(value, path, fails)
+
+    def check(self, value):
+        return self.target.check(value)
+
+    def coerce(self, value, mode):
+        return self.target.coerce(value, mode)
+
+
+def convert_run(convert, values, converted):
+    """Append `values` converted by `convert` to list `converted`, leaving
+    those that fail to convert as they are."""
+    start, items = len(converted), iter(values)
+    while True:
+        try:
+            # Values converted before a failure are kept by `extend`
+            converted.extend(imap(convert, items))
+            return
+        except (TypeError, ValueError):
+            converted.append(values[len(converted) - start])
+
+
+def is_index(key, length):
+    """Return whether `key` is a list index less than `length`."""
+    return type(key) in (int, long, Index) and 0 <= key < length
+
+
+# Lists of primitives are coerced in chunks of this many values.
+coerce_chunk_size = 1024
+
+# Shared nodes
+any_node = AnyNode()
+primitive_nodes = {}
+
+
+def primitive_node(name, nullable):
+    """Return the (shared) node of primitive type `name`."""
+    key = (name, nullable)
+    node = primitive_nodes.get(key)
+    if node is None:
+        node = primitive_nodes.setdefault(key, PrimitiveNode(name, nullable))
+    return node
@@ -0,0 +1,229 @@
+"""Schema-directed JSON decoding.
+
+Provides:
+    `decode`: Decodes a JSON document, validating (and optionally coercing)
+        it against a datatype while it is parsed.
+    `InvalidDocumentError`: Raised by `decode` for documents not matching
+        their datatype.
+"""
+
+__all__ = ['decode', 'InvalidDocumentError']
+
+from itertools import count
+from json import JSONDecoder
+from json.decoder import WHITESPACE, errmsg
+from json.scanner import make_scanner
+
+from datatype.compiler import (ListNode, ObjectNode, ReferenceNode,
+        TupleNode, cached_compile)
+from datatype.tools import Failure
+
+
+# Parses a single JSON value (using the C scanner, where available)
+scanner = make_scanner(JSONDecoder())
+whitespace = WHITESPACE.match
+
+
+class InvalidDocumentError(ValueError):
+    """Raised when `decode` encounters a value not matching its datatype."""
+
+    def __init__(self, fails=None):
+        ValueError.__init__(self, *(fails or []))
+        # List of things that went wrong in validation
+        self.failures = fails or []
+
+
+def decode(datatype, source, coerce=False):
+    """Decode JSON document `source` (a str or unicode), validating it
+    against `datatype` as it is parsed.
+
+    Decoding stops at the first invalid value, raising
+    `InvalidDocumentError` with its failure (one of those
+    `datatype.validation.failures` gives for the decoded document).  Invalid
+    JSON raises ValueError, as `json.loads` does.
+
+    Optional Arguments:
+        coerce: if true, values are coerced (see
+        `datatype.coercion.coerce_value`) as they are parsed, and validated
+        once coerced
+
+    Example:
+        >>> decode({'foo': ['int']}, '{"foo": [1, 2]}')
+        {u'foo': [1, 2]}
+        >>> decode({'foo': ['int']}, '{"foo": ["1", 2]}', coerce=True)
+        {u'foo': [1, 2]}
+        >>> try:
+        ...     decode({'foo': ['int']}, '{"foo": [1, "a", 3]}')
+        ... except InvalidDocumentError as e:
+        ...     print e.failures
+        [u'foo[1]: expected int, got unicode']
+
+    Dictionaries and lists holding dictionaries or lists of the datatype
+    are parsed value by value, so invalid documents are rejected without
+    reading much further.  Other values (eg. lists of primitives, choices
+    and tagged unions) are parsed whole, before being validated.
+    """
+    decoder = Decoder(source, coerce)
+    value, end = decoder.value(cached_compile(datatype).root,
+            skip(source, 0), None)
+    end = skip(source, end)
+    if end != len(source):
+        raise ValueError(errmsg('Extra data', source, end, len(source)))
+    return value
+
+
+class Decoder(object):
+    """Parses a JSON document, directed by compiled nodes."""
+
+    def __init__(self, source, coerce):
+        self.source = source
+        self.coerce = coerce
+        self.parsers = {}   # id(node) -> parse method, filled as seen
+
+    def expect(self, idx, chars, message):
+        """Return character at `idx`, raising ValueError with `message` if
+        it's not one of `chars`."""
+        char = self.source[idx:idx + 1]
+        if not char or char not in chars:
+            raise ValueError(errmsg(message, self.source, idx))
+        return char
+
+    def value(self, node, idx, path):
+        """Return (value of `node` starting at `idx`, index of its end)."""
+        parse = self.parsers.get(id(node))
+        if parse is None:
+            parse = self.parsers[id(node)] = self.parser(node)
+        return parse(node, idx, path)
+
+    def parser(self, node):
+        """Return method parsing values of `node`.
+
+        Containers are only parsed value by value if they contain others,
+        since the whole value can be parsed much faster.
+        """
+        if isinstance(node, ReferenceNode):
+            return self.parse_ReferenceNode
+        elif isinstance(node, ListNode):
+            children = [node.item]
+        elif isinstance(node, TupleNode):
+            children = node.items
+        elif isinstance(node, ObjectNode):
+            children = node.properties.values() + [node.default]
+        else:
+            return self.parse_value
+
+        if any(isinstance(resolve(x), containers) for x in children):
+            return getattr(self, 'parse_%s' % type(node).__name__)
+        return self.parse_value
+
+    def parse_value(self, node, idx, path):
+        """Parse a whole value, then validate it."""
+        try:
+            value, end = scanner(self.source, idx)
+        except StopIteration:
+            raise ValueError(errmsg('No JSON object could be decoded',
+                self.source, idx))
+
+        if self.coerce:
+            value = node.coerce(value, 'inplace')
+        if not node.check(value):
+            fails = []
+            node.failures(value, path, fails)
+            reject(fails[0])
+        return value, end
+
+    def parse_ReferenceNode(self, node, idx, path):
+        return self.value(node.target, idx, path)
+
+    def parse_ListNode(self, node, idx, path):
+        source = self.source
+        if source[idx:idx + 1] != '[':
+            return self.parse_value(node, idx, path)
+
+        value, item = [], node.item
+        idx = skip(source, idx + 1)
+        if source[idx:idx + 1] != ']':
+            for i in count():
+                v, idx = self.value(item, idx, (path, i, True))
+                value.append(v)
+                idx = skip(source, idx)
+                if self.expect(idx, ',]', 'Expecting , delimiter') == ']':
+                    break
+                idx = skip(source, idx + 1)
+        return value, idx + 1
+
+    def parse_TupleNode(self, node, idx, path):
+        source = self.source
+        if not node.items or source[idx:idx + 1] != '[':
+            return self.parse_value(node, idx, path)
+
+        value, dlen = [], len(node.items)
+        idx = skip(source, idx + 1)
+        if source[idx:idx + 1] != ']':
+            for i in count():
+                if i >= dlen:
+                    reject(Failure(path, 'unexpected_value', None, i))
+                v, idx = self.value(node.items[i], idx, (path, i, True))
+                value.append(v)
+                idx = skip(source, idx)
+                if self.expect(idx, ',]', 'Expecting , delimiter') == ']':
+                    break
+                idx = skip(source, idx + 1)
+
+        if len(value) < dlen:
+            reject(Failure(path, 'missing_value', len(value)))
+        return value, idx + 1
+
+    def parse_ObjectNode(self, node, idx, path):
+        source = self.source
+        if source[idx:idx + 1] != '{':
+            return self.parse_value(node, idx, path)
+
+        value = {}
+        properties, default = node.properties, node.default
+        all_keys, any_keys = node.all_keys, node.any_keys
+        idx = skip(source, idx + 1)
+        if source[idx:idx + 1] != '}':
+            while True:
+                self.expect(idx, '"', 'Expecting property name')
+                key, idx = scanner(source, idx)
+                idx = skip(source, idx)
+                self.expect(idx, ':', 'Expecting : delimiter')
+
+                if not (any_keys or key in all_keys):
+                    reject(Failure(path, 'unexpected_property', None, key))
+                value[key], idx = self.value(properties.get(key, default),
+                        skip(source, idx + 1), (path, key, False))
+
+                idx = skip(source, idx)
+                if self.expect(idx, ',}', 'Expecting , delimiter') == '}':
+                    break
+                idx = skip(source, idx + 1)
+
+        missing = node.required_keys.difference(value)
+        if missing:
+            reject(Failure(path, 'missing_property', min(missing)))
+        return value, idx + 1
+
+
+# Nodes of values that may be parsed value by value
+containers = (ListNode, TupleNode, ObjectNode)
+
+
+def skip(source, idx):
+    """Return index of the first non-whitespace character from `idx`."""
+    if source[idx:idx + 1] in ' \t\n\r':
+        return whitespace(source, idx).end()
+    return idx
+
+
+def resolve(node):
+    """Return node referred to by `node` (if a reference)."""
+    while isinstance(node, ReferenceNode):
+        node = node.target
+    return node
+
+
+def reject(failure):
+    """Raise `InvalidDocumentError` for `failure`."""
+    raise InvalidDocumentError([failure.render()])
@@ -1,14 +1,23 @@
 import logging
 
 from functools import wraps
+from inspect import getargspec
+from itertools import count, islice
+from threading import Lock
+from time import time
 
 from doctools import append_var_to_docs
 
-from datatype.validation import failures
+from datatype.codegen import generate
+from datatype.compiler import ListNode, compile
 
 
 logger = logging.getLogger('datatype')
 
+# Set false to skip validation by all decorated functions, eg. in production.
+validation_enabled = True
+
+
 class BadReturnValueError(Exception):
     """Raised when `returns` decorator encounters a return value
     not matching it's given datatype."""
@@ -18,13 +27,29 @@ class BadReturnValueError(Exception):
         self.failures = fails or []
 
 
-def returns(dfn, strict=True):
+class BadArgumentError(Exception):
+    """Raised when `accepts` decorator encounters an argument not matching
+    it's given datatype."""
+
+    def __init__(self, fails=None):
+        # List of things that went wrong in validation
+        self.failures = fails or []
+
+
+def returns(dfn, strict=True, every=None, per_second=None, first=None):
     """Make decorators to watch return values of functions to ensure
     they match the given datatype definition.
 
     Optional Arguments:
         strict: if false, unexpected values on dictionaries will not raise an
         exception
+        every: only validate one in this many calls
+        per_second: validate at most this many calls per second
+        first: only validate this many calls (per process)
+
+    Sampling options may be combined, eg. `every=10, first=1000` validates
+    every tenth of the first thousand calls.  No validation is done at all
+    while `validation_enabled` is false.
 
     Example:
         >>> @returns('int')
@@ -35,21 +60,19 @@ def returns(dfn, strict=True):
         BadReturnValueError
     """
     def decorator(fn):
-
         # Add return-datatype info to function doc-block
         append_var_to_docs(fn, "Return datatype", dfn)
+        validator = compile(dfn)
+        sampled = (every, per_second, first) != (None, None, None)
+        sample = Sampler(every, per_second, first) if sampled else None
 
         @wraps(fn)
         def wrapped_function(*args, **kwargs):
             ret = fn(*args, **kwargs)
 
             # Check for failure and raise
-            fails = failures(dfn, ret)
-            if fails:
-                if strict or _get_bad_values(fails):
-                    raise BadReturnValueError(fails)
-                else:
-                    logger.warning(fails)
+            if validation_enabled and (sample is None or sample()):
+                _check_value(validator, ret, strict)
 
             # All is well, return as usual
             return ret
@@ -57,15 +80,20 @@ def returns(dfn, strict=True):
     return decorator
 
 
-def returns_iter(dfn, strict=True):
+def returns_iter(dfn, strict=True, batch_size=None):
     """Validate output of iterator/generator function.
 
     Note: exceptions for bad return datatypes will not be raised until the bad
-    value of the iterator is consumed.
+    value of the iterator is consumed.  No validation is done while
+    `validation_enabled` is false.
 
     Optional Arguments:
         strict: if false, unexpected values on dictionaries will not raise an
         exception
+        batch_size: read this many values from the iterator at a time,
+        validating them all before any is yielded, with a function generated
+        for validating lists of values (see `datatype.codegen`).  Larger
+        batches trade latency (and memory) for throughput.
 
     Example:
         >>> @returns_iter('str')
@@ -77,22 +105,160 @@ def returns_iter(dfn, strict=True):
     """
     def decorator(fn):
         append_var_to_docs(fn, "Return datatype (iterator of)", dfn)
+        validator = compile(dfn)
 
         @wraps(fn)
         def wrapped_function(*args, **kwargs):
             for value in fn(*args, **kwargs):
-                fails = failures(dfn, value)
-                if fails:
-                    if strict or _get_bad_values(fails):
-                        raise BadReturnValueError(fails)
-                    else:
-                        logger.warning(fails)
-
+                if validation_enabled:
+                    _check_value(validator, value, strict)
                 yield value
+
+        if batch_size is None:
+            return wrapped_function
+
+        # Batches are validated as a list of values, only checking values
+        # one at a time (for failures relative to each) if any is invalid
+        _, validate_batch = generate(ListNode(validator.root))
+
+        @wraps(fn)
+        def batched_function(*args, **kwargs):
+            values = iter(fn(*args, **kwargs))
+            while True:
+                batch = list(islice(values, batch_size))
+                if not batch:
+                    return
+                if validation_enabled:
+                    fails = []
+                    validate_batch(batch, None, fails)
+                    if fails:
+                        for value in batch:
+                            _check_value(validator, value, strict)
+                for value in batch:
+                    yield value
+
+        return batched_function
+    return decorator
+
+
+def accepts(dfns, strict=True):
+    """Make decorators to ensure arguments of functions match the given
+    datatype definitions.
+
+    `dfns` is a dictionary of argument name -> datatype definition.
+    Definitions are compiled, and names bound to argument positions, when the
+    function is decorated.  Arguments not given (left to their defaults) are
+    not validated.  Failure paths are prefixed by the argument name.
+
+    Optional Arguments:
+        strict: if false, unexpected values on dictionaries will not raise an
+        exception
+
+    Example:
+        >>> @accepts({'count': 'int'})
+        ... def myfunction(name, count=1):
+        ...     return name * count
+        >>> myfunction('foo', count='3')
+        Traceback (most recent call last):
+        BadArgumentError
+    """
+    def decorator(fn):
+        append_var_to_docs(fn, "Argument datatypes", dfns)
+
+        args, _, keywords, _ = getargspec(fn)
+        bindings = []
+        for name, dfn in dfns.iteritems():
+            if name in args:
+                position = args.index(name)
+            elif keywords is not None:
+                position = None
+            else:
+                raise ValueError('%s() has no argument %r' % (
+                    fn.__name__, name))
+            bindings.append((name, position, compile(dfn)))
+
+        @wraps(fn)
+        def wrapped_function(*args, **kwargs):
+            if validation_enabled:
+                _check_arguments(bindings, args, kwargs, strict)
+            return fn(*args, **kwargs)
         return wrapped_function
     return decorator
 
 
+class Sampler(object):
+    """Decides which calls of a decorated function are validated.
+
+    Calling a sampler counts a call, returning whether it should be
+    validated.  See `returns` for the meaning of arguments.
+    """
+
+    def __init__(self, every=None, per_second=None, first=None):
+        for name, arg in [('every', every), ('per_second', per_second),
+                ('first', first)]:
+            if arg is not None and arg < 1:
+                raise ValueError('%s must be at least 1, got %r' % (
+                    name, arg))
+
+        self.every = every
+        self.per_second = per_second
+        self.first = first
+        self.calls = count()
+        self.lock = Lock()
+        self.second, self.validated = None, 0
+
+    def __call__(self):
+        call = next(self.calls)
+        if self.first is not None and call >= self.first:
+            return False
+        if self.every is not None and call % self.every:
+            return False
+        if self.per_second is not None:
+            with self.lock:
+                second = int(time())
+                if second != self.second:
+                    self.second, self.validated = second, 0
+                if self.validated >= self.per_second:
+                    return False
+                self.validated += 1
+        return True
+
+
+def _check_value(validator, value, strict):
+    """Raise `BadReturnValueError` if `value` isn't valid, or just log a
+    warning if not `strict` and only unexpected properties were found."""
+    if not validator.is_valid(value):
+        # Not profiled again, as is_valid already counted this value
+        _report(validator._failure_details(value), strict,
+                BadReturnValueError)
+
+
+def _check_arguments(bindings, args, kwargs, strict):
+    """As `_check_value`, for arguments bound by `accepts`."""
+    fails = []
+    for name, position, validator in bindings:
+        if position is not None and position < len(args):
+            value = args[position]
+        elif name in kwargs:
+            value = kwargs[name]
+        else:
+            continue
+
+        if not validator.is_valid(value):
+            validator.root.failures(value, (None, name, False), fails)
+
+    if fails:
+        _report(fails, strict, BadArgumentError)
+
+
+def _report(fails, strict, error):
+    messages = [x.render() for x in fails]
+    if strict or _get_bad_values(fails):
+        raise error(messages)
+    else:
+        logger.warning(messages)
+
+
 def _get_bad_values(fails):
-    return [x for x in fails if 'unexpected property' not in x]
+    return [x for x in fails if x.code != 'unexpected_property']
 
@@ -2,6 +2,21 @@
 special types."""
 
 
+# Primitive type-names, and the python types valid for each
+primitives = {
+        'int':   (int,),
+        'float': (float,),
+        'str':   (str, unicode),
+        'bool':  (bool,)
+    }
+
+# Types which may be coerced to a primitive, and the primitive constructors
+coercable_types = frozenset(reduce(list.__add__,
+        (list(x) for x in primitives.itervalues())))
+
+coerce_to = dict((k, v[0]) for k, v in primitives.iteritems())
+
+
 def typename(datatype):
     """Returns the type-name of the given datatype definition or chunk."""
     default = 'type'
@@ -46,6 +61,20 @@ def reference(name):
     return special_type('reference', name=name)
 
 
+def tagged_union(tag, variants):
+    """Returns a 'tagged_union' dictionary, for dictionaries whose `tag` key
+    selects the datatype (from `variants`) of the whole dictionary.
+
+    Variants needn't define the tag key themselves.
+
+    Example:
+        >>> union = tagged_union('kind', {'circle': {'radius': 'float'}})
+        >>> union['_type_'], union['tag'], union['variants']
+        ('tagged_union', 'kind', {'circle': {'radius': 'float'}})
+    """
+    return special_type('tagged_union', tag=tag, variants=variants)
+
+
 def literal(value):
     """Returns a 'literal' dictionary.
 
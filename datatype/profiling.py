@@ -0,0 +1,171 @@
+"""Profiling of validation and coercion.
+
+Validators (and so `failures`, `is_valid`, `coerce_value` and the decorators)
+call profiling hooks after each value they validate or coerce.  No hooks are
+installed by default, in which case profiling costs a single check per value.
+
+Provides:
+    `add_hook`: Install a callable invoked after each profiled operation.
+    `remove_hook`: Uninstall a hook.
+    `Stats`: Hook collecting per-datatype statistics.
+"""
+
+__all__ = ['add_hook', 'remove_hook', 'Stats']
+
+from collections import Counter
+from timeit import default_timer
+
+from datatype.tools import Index, fingerprint, joinpaths
+
+
+# Installed hooks, called as:
+#   hook(validator, operation, value, result, elapsed)
+# where operation is 'failures' (result is a list of failures), 'is_valid' or
+# 'coerce', and elapsed is the time taken in seconds.
+hooks = []
+
+
+def add_hook(hook):
+    """Install `hook`, to be called after each profiled operation."""
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Uninstall `hook`."""
+    hooks.remove(hook)
+
+
+def profiled(validator, operation, function, value):
+    """Return `function(value)`, passing its result and timing to hooks."""
+    start = default_timer()
+    result = function(value)
+    elapsed = default_timer() - start
+
+    for hook in list(hooks):
+        hook(validator, operation, value, result, elapsed)
+    return result
+
+
+class Stats(object):
+    """Hook collecting statistics of each datatype validated or coerced.
+
+    Install with `add_hook`, or use as a context manager.  Datatypes of the
+    same structure share statistics.
+
+    Optional Arguments:
+        sizes: if true, count the values within each value validated or
+        coerced (see `SchemaStats.values`).  This walks every value a second
+        time, so is off by default
+
+    Example:
+        >>> from datatype.validation import failures
+        >>> datatype = {'foo': ['int']}
+        >>> with Stats(sizes=True) as stats:
+        ...     failures(datatype, {'foo': [1, 'a', 'b']})
+        ...     failures(datatype, {'foo': []})
+        ['foo[1]: expected int, got str', 'foo[2]: expected int, got str']
+        []
+        >>> schema = stats.of(datatype)
+        >>> schema.calls, schema.values, schema.invalid
+        (2, 7, 1)
+        >>> schema.failure_codes
+        Counter({'type': 2})
+        >>> schema.failure_paths
+        Counter({'foo[]': 2})
+    """
+
+    def __init__(self, sizes=False):
+        self.sizes = sizes
+        # fingerprint of datatype -> SchemaStats
+        self.schemas = {}
+        # id(datatype) -> (datatype, SchemaStats), keeping the datatype alive
+        self.seen = {}
+
+    def __call__(self, validator, operation, value, result, elapsed):
+        datatype = validator.datatype
+        if id(datatype) in self.seen:
+            schema = self.seen[id(datatype)][1]
+        else:
+            key = fingerprint(datatype)
+            schema = self.schemas.get(key)
+            if schema is None:
+                schema = self.schemas[key] = SchemaStats(datatype)
+            self.seen[id(datatype)] = (datatype, schema)
+
+        schema.calls += 1
+        schema.time += elapsed
+        if self.sizes:
+            schema.values += count_values(value)
+        if operation == 'failures':
+            if result:
+                schema.invalid += 1
+            for failure in result:
+                schema.failure_codes[failure.code] += 1
+                schema.failure_paths[path_pattern(failure.path)] += 1
+        elif operation == 'is_valid' and not result:
+            schema.invalid += 1
+
+    def of(self, datatype):
+        """Return `SchemaStats` of `datatype`, or None if it wasn't seen."""
+        return self.schemas.get(fingerprint(datatype))
+
+    def summary(self):
+        """Return `SchemaStats` of each datatype seen, most costly first."""
+        return sorted(self.schemas.itervalues(), key=lambda x: -x.time)
+
+    def clear(self):
+        self.schemas.clear()
+        self.seen.clear()
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_hook(self)
+
+
+class SchemaStats(object):
+    """Statistics of a single datatype.
+
+    `calls` counts operations, taking `time` seconds in total.  `values`
+    totals the size of the values given (lists and dictionaries, and all
+    values within them, whether or not validation reached them), if counted
+    with `Stats(sizes=True)`.  `invalid` counts invalid values found, with
+    their failures counted by code in `failure_codes` and by path in
+    `failure_paths` (list indices are left out of paths, eg. 'foo[].bar').
+    """
+
+    __slots__ = ('datatype', 'calls', 'time', 'values', 'invalid',
+            'failure_codes', 'failure_paths')
+
+    def __init__(self, datatype):
+        self.datatype = datatype
+        self.calls = self.values = self.invalid = 0
+        self.time = 0.0
+        self.failure_codes = Counter()
+        self.failure_paths = Counter()
+
+    def __repr__(self):
+        return '<SchemaStats of %r: %d calls in %.6fs>' % (
+                self.datatype, self.calls, self.time)
+
+
+def count_values(value):
+    """Return number of values in `value`, including itself."""
+    if isinstance(value, dict):
+        return 1 + sum(count_values(x) for x in value.itervalues())
+    elif isinstance(value, list):
+        return 1 + sum(count_values(x) for x in value)
+    return 1
+
+
+def path_pattern(path):
+    """Return failure `path` as a string, without list indices."""
+    pattern = ''
+    for segment in path:
+        if isinstance(segment, Index):
+            pattern += '[]'
+        else:
+            pattern = joinpaths(pattern, segment, '.')
+    return pattern
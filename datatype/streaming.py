@@ -0,0 +1,125 @@
+"""Streaming validation of large JSON documents.
+
+Provides:
+    `iter_failures`: Yields failures of each invalid item of a JSON array
+        or newline-delimited JSON file (or any iterable), one at a time.
+    `iter_json_array`: Yields items of a top-level JSON array from a file.
+    `iter_json_lines`: Yields items of a newline-delimited JSON file.
+"""
+
+__all__ = ['iter_failures', 'iter_json_array', 'iter_json_lines']
+
+import json
+import re
+
+from datatype.compiler import ListNode, cached_compile
+
+
+whitespace = re.compile(r'[ \t\n\r]*').match
+
+# Characters that may follow an item of a JSON array
+delimiters = frozenset(' \t\n\r,]')
+
+
+def iter_failures(datatype, source, lines=False):
+    """Validate items of `source` one at a time against list `datatype`,
+    yielding (index, failures) for each invalid item.
+
+    `source` may be a file object containing a JSON array (or, if `lines` is
+    true, newline-delimited JSON), or any iterable of already parsed items.
+    Only one item is held in memory at a time.  Failure paths are those
+    `datatype.validation.failures` would give for the whole list.
+
+    Example:
+        >>> from StringIO import StringIO
+        >>> source = StringIO('[{"foo": 1}, {"foo": "a"}, {}]')
+        >>> for index, fails in iter_failures([{'foo': 'int'}], source):
+        ...     print index, fails
+        1 [u'[1].foo: expected int, got unicode']
+        2 ['[2]: missing required property: "foo"']
+    """
+    root = cached_compile(datatype).root
+    if not isinstance(root, ListNode):
+        raise ValueError('streaming validation requires a list datatype, '
+                'got %r' % (datatype,))
+
+    if hasattr(source, 'read'):
+        source = iter_json_lines(source) if lines else iter_json_array(source)
+
+    check, failures = root.item.check, root.item.failures
+    for i, value in enumerate(source):
+        if not check(value):
+            fails = []
+            failures(value, (None, i, True), fails)
+            yield i, [x.render() for x in fails]
+
+
+def iter_json_array(fileobj, chunk_size=65536):
+    """Yield the items of the JSON array in `fileobj`, reading `chunk_size`
+    bytes at a time.
+
+    Example:
+        >>> from StringIO import StringIO
+        >>> list(iter_json_array(StringIO('[1, [2, 3], {"4": 5}]')))
+        [1, [2, 3], {u'4': 5}]
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    state = 'open'
+
+    while True:
+        pos = whitespace(buf, pos).end()
+        if pos < len(buf):
+            char = buf[pos]
+            if state == 'closed':
+                raise ValueError('unexpected data after JSON array: %r'
+                        % char)
+            elif state == 'open':
+                if char != '[':
+                    raise ValueError('expected JSON array, got %r' % char)
+                pos, state = pos + 1, 'first'
+                continue
+            elif char == ']' and state in ('first', 'separator'):
+                pos, state = pos + 1, 'closed'
+                continue
+            elif state == 'separator':
+                if char != ',':
+                    raise ValueError('expected "," or "]", got %r' % char)
+                pos, state = pos + 1, 'item'
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                # A number may be truncated by the end of the buffer (even
+                # once something after it is read, eg. '1.'), so is only
+                # accepted once followed by a delimiter
+                if eof or (end < len(buf) and (buf[end - 1] in '"]}' or
+                        buf[end] in delimiters)):
+                    pos, state = end, 'separator'
+                    yield item
+                    continue
+        elif eof:
+            if state == 'closed':
+                return
+            raise ValueError('unexpected end of JSON array')
+
+        chunk = fileobj.read(chunk_size)
+        buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+
+
+def iter_json_lines(fileobj):
+    """Yield the item on each (non-blank) line of `fileobj`.
+
+    Example:
+        >>> from StringIO import StringIO
+        >>> list(iter_json_lines(StringIO('1\\n\\n"two"\\n[3]\\n')))
+        [1, u'two', [3]]
+    """
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
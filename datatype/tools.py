@@ -1,10 +1,13 @@
 """Datatype utility functions.  Used by datatype validation and coercion."""
 
+import re
+
 from collections import defaultdict
+from copy import copy
 from functools import partial
-from itertools import count
+from itertools import count, izip, repeat
 
-from datatype.language import typename
+from datatype.language import special_type, typename
 
 
 class NewValue(object):
@@ -19,9 +22,17 @@ class NewValue(object):
 class Choice(object):
     """Datatype representing a choice between multiple datatypes."""
 
+    __slots__ = ('choices',)
+
     def __init__(self, choices):
         self.choices = choices
 
+    def __getstate__(self):
+        return (self.choices,)
+
+    def __setstate__(self, state):
+        self.choices, = state
+
     def __iter__(self):
         return iter(self.choices)
 
@@ -44,10 +55,64 @@ class Choice(object):
 class Literal(object):
     """Object representing a literal value."""
 
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 
+class TaggedUnion(object):
+    """Datatype representing a tagged union, given to walk-callbacks when
+    the value doesn't select any of its variants."""
+
+    __slots__ = ('tag', 'variants')
+
+    def __init__(self, tag, variants):
+        self.tag = tag
+        self.variants = variants
+
+
+class UnknownTag(object):
+    """Datatype of a tagged union's tag, given to walk-callbacks (at the
+    tag's path) when its value selects none of the variants."""
+
+    __slots__ = ('tags',)
+
+    def __init__(self, tags):
+        self.tags = tags
+
+
+def tagged_variant(tag, tag_value, datatype, named_types=None):
+    """Return variant `datatype` of a tagged union, requiring its tag.
+
+    Variants referring to named dictionaries (in `named_types`) are
+    replaced by a copy of the dictionary, requiring the tag too.
+    """
+    resolved = datatype
+    while named_types and typename(resolved) == 'reference':
+        resolved = named_types[resolved['name']]
+    if isinstance(resolved, dict) and typename(resolved) == 'type':
+        datatype = dict(resolved)
+        datatype.setdefault(tag, special_type('literal', value=tag_value))
+    return datatype
+
+
+def select_variant(variants, value, tag):
+    """Return tag value of dictionary `value` if it selects one of
+    `variants`, otherwise `unknown_tag`."""
+    try:
+        tag_value = value[tag]
+        if tag_value in variants:
+            return tag_value
+    except (KeyError, TypeError):
+        pass
+    return unknown_tag
+
+
+# Returned by `select_variant` for values not selecting any variant.
+unknown_tag = object()
+
+
 def dict_datatypes(datatype):
     default = datatype.get('_any_')
     datatypes = defaultdict(lambda: default)
@@ -65,12 +130,12 @@ def dict_datatypes(datatype):
 def extract_named_types(datatype):
     """Walks the given datatype, removes the named-wrappers from around the
     types and returns a dictionary of names -> types as well as the cleaned
-    datatype."""
+    datatype.  The given datatype is left unchanged."""
     named_types = {}
 
+    name = None
     if typename(datatype) == 'named':
-        named_types[datatype['name']] = datatype['value']
-        datatype = datatype['value']
+        name, datatype = datatype['name'], datatype['value']
 
     dt_type = type(datatype)
     if dt_type in (list, dict):
@@ -78,18 +143,32 @@ def extract_named_types(datatype):
                 list: lambda: enumerate(datatype),
                 dict: lambda: datatype.iteritems(),
             }
+        cleaned = dt_type(datatype)
         for key, subtype in generators[dt_type]():
             sub_named_types, subtype = extract_named_types(subtype)
             named_types.update(sub_named_types)
-            datatype[key] = subtype
+            cleaned[key] = subtype
+        datatype = cleaned
+
+    if name is not None:
+        # Names nested within take precedence
+        named_types = dict([(name, datatype)] + named_types.items())
 
     return named_types, datatype
 
 
-def walk(datatype, value, callback):
+def walk(datatype, value, callback, mode='copy'):
     """Walk the value and datatype with the given callback.
 
-    Example callback: lambda path, datatype, actual, options: None"""
+    Example callback: lambda path, datatype, actual, options: None
+
+    Optional Arguments:
+        mode: how lists and dictionaries are returned.  'copy' rebuilds
+        every one of them, 'copy_on_write' only copies those containing a
+        replaced value (see `NewValue`), 'inplace' updates those containing
+        a replaced value and 'readonly' never changes containers, returning
+        the value as given.
+    """
     named_types, datatype = extract_named_types(datatype)
 
     def _walk(datatype, value, callback, path='', options=None):
@@ -107,6 +186,23 @@ def walk(datatype, value, callback):
         elif dt_type == 'literal':
             datatype = Literal(datatype.get('value'))
 
+        # Tagged unions are walked as the variant selected by the value's
+        # tag (including those reached through a reference)
+        if typename(datatype) == 'tagged_union':
+            tag, variants = datatype['tag'], datatype['variants']
+            tag_value = unknown_tag
+            if isinstance(value, dict):
+                tag_value = select_variant(variants, value, tag)
+            if tag_value is unknown_tag:
+                datatype = TaggedUnion(tag, variants)
+                if isinstance(value, dict) and tag in value:
+                    callback(joinpaths(path, tag, '.'),
+                            UnknownTag(sorted(variants)), value[tag], [])
+            else:
+                datatype = tagged_variant(tag, tag_value, variants[tag_value],
+                        named_types)
+                return _walk(datatype, value, callback, path, options)
+
         new_value = callback(path, datatype, value, options)
 
         # Are we replacing the value?
@@ -119,24 +215,48 @@ def walk(datatype, value, callback):
             mk_path = lambda i: joinpaths(path, '[%d]' % i)
 
             if dt_len == 1:   # list of `a`
-                value = [_walk(datatype[0], v, callback, mk_path(i))
-                         for i, v in enumerate(value)]
-            elif dt_len > 1:  # tuple
-                value = [_walk(d, v, callback, mk_path(i))
-                         for i, d, v in zip(count(), datatype, value)]
+                datatypes = repeat(datatype[0])
+            else:             # tuple
+                datatypes = datatype
+
+            if dt_len:
+                value = rebuild(value, mode, (
+                    (i, v, _walk(d, v, callback, mk_path(i)))
+                    for i, d, v in izip(count(), datatypes, value)))
 
         # Walk objects (dictionaries)
         elif are_type(dict, datatype, value):
             key_dts = dict_datatypes(datatype)
             mk_path = lambda k: joinpaths(path, k, '.')
 
-            value = dict((k, _walk(key_dts[k], v, callback, mk_path(k)))
-                for k, v in value.iteritems())
+            value = rebuild(value, mode, (
+                (k, v, _walk(key_dts[k], v, callback, mk_path(k)))
+                for k, v in value.iteritems()))
 
         return value
     return _walk(datatype, value, callback)
 
 
+def rebuild(value, mode, walked):
+    """Return list or dictionary `value` updated with walked values.
+
+    `walked` is an iterable of (key, old value, new value), and `mode` is as
+    described by `walk`.
+    """
+    if mode == 'copy':
+        if isinstance(value, dict):
+            return dict((k, new) for k, _, new in walked)
+        return [new for _, _, new in walked]
+
+    result = value
+    for key, old, new in walked:
+        if new is not old and mode != 'readonly':
+            if result is value and mode == 'copy_on_write':
+                result = copy(value)
+            result[key] = new
+    return result
+
+
 def are_type(type_, *vars_):
     return all(isinstance(v, type_) for v in vars_)
 
@@ -145,6 +265,128 @@ def joinpaths(p1, p2, delim=None):
     return '%s%s%s' % (p1, delim, p2) if delim and p1 else '%s%s' % (p1, p2)
 
 
+def parse_path(path):
+    """Return tuple of dictionary keys and list indices (as `Index`) of a
+    path formatted as 'foo[0].bar' (see `Failure.path`).
+
+    Example:
+        >>> parse_path('foo[0].bar')
+        ('foo', [0], 'bar')
+        >>> parse_path('')
+        ()
+    """
+    segments, pos = [], 0
+    while pos < len(path):
+        # Keys after the first are preceded by '.', indices never are
+        match = path_segment(path, pos)
+        if match is None or bool(match.group(1)) != bool(
+                match.group(2) and pos):
+            raise ValueError('invalid path %r' % path)
+        _, key, index = match.groups()
+        segments.append(key if index is None else Index(index))
+        pos = match.end()
+    return tuple(segments)
+
+
+path_segment = re.compile(r'(\.)?(?:([^.\[]+)|\[(\d+)\])').match
+
+
+class Failure(object):
+    """A validation failure, only formatted as a message when rendered.
+
+    `location` is where the failure was found: None for the top-level
+    value, or (parent location, dictionary key or list index, is_index).
+    `code` is one of the keys of `failure_templates`, and `expected` and
+    `actual` depend on it:
+        'null': unexpected None
+        'type': expected type name, actual type name
+        'missing_property': expected dictionary key
+        'unexpected_property': actual dictionary key
+        'missing_value': expected tuple index
+        'unexpected_value': actual tuple index
+        'choice': expected `Choice`, actual value
+        'literal': expected literal value, actual value
+        'unknown_tag': expected list of tag values, actual tag value
+    """
+
+    __slots__ = ('location', 'code', 'expected', 'actual')
+
+    def __init__(self, location, code, expected=None, actual=None):
+        self.location = location
+        self.code = code
+        self.expected = expected
+        self.actual = actual
+
+    @property
+    def path(self):
+        """Tuple of dictionary keys and list indices (as `Index`) leading to
+        the failure."""
+        segments = []
+        location = self.location
+        while location is not None:
+            location, segment, is_index = location
+            segments.append(Index(segment) if is_index else segment)
+        return tuple(reversed(segments))
+
+    def path_string(self):
+        """Returns path formatted as 'foo[0].bar'."""
+        path = ''
+        for segment in self.path:
+            if isinstance(segment, Index):
+                path = joinpaths(path, '[%d]' % segment)
+            else:
+                path = joinpaths(path, segment, '.')
+        return path
+
+    def message(self):
+        """Returns failure message, without path."""
+        return failure_templates[self.code] % {
+                'expected': self.expected, 'actual': self.actual}
+
+    def render(self):
+        """Returns failure message, prefixed by path (if any)."""
+        path, message = self.path_string(), self.message()
+        return '%s: %s' % (path, message) if path else message
+
+    __str__ = render
+
+    def __repr__(self):
+        return '<Failure %r>' % self.render()
+
+
+def tuple_length_failures(fails, path, dlen, vlen):
+    """Append failures for a tuple of length `vlen`, expecting `dlen`."""
+    if dlen > vlen:
+        fails.extend(Failure(path, 'missing_value', i)
+                for i in xrange(vlen, dlen))
+    else:
+        fails.extend(Failure(path, 'unexpected_value', None, i)
+                for i in xrange(dlen, vlen))
+
+
+class Index(int):
+    """List index within a failure path."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return '[%d]' % self
+
+
+# Failure code -> message template
+failure_templates = {
+        'null': 'unexpected null for non-nullable type',
+        'type': 'expected %(expected)s, got %(actual)s',
+        'missing_property': 'missing required property: "%(expected)s"',
+        'unexpected_property': 'unexpected property "%(actual)s"',
+        'missing_value': 'missing required value at index %(expected)s',
+        'unexpected_value': 'unexpected value at index %(actual)s',
+        'choice': '%(actual)s is none of expected %(expected)s',
+        'literal': 'expected literal value "%(expected)s", got "%(actual)s"',
+        'unknown_tag': 'unknown tag "%(actual)s"',
+    }
+
+
 def parse_name_options(key, possible_options):
     """Pull dictionary key options from key and return both as tuple.
 
@@ -164,3 +406,16 @@ def parse_name_options(key, possible_options):
 parse_dict_key = partial(parse_name_options, possible_options=['optional'])
 parse_primitive = partial(parse_name_options, possible_options=['nullable'])
 
+
+def fingerprint(datatype):
+    """Return hashable representation of `datatype`'s structure."""
+    dt_type = type(datatype)
+    if dt_type is dict:
+        return (dt_type, frozenset((type(k), k, fingerprint(v))
+                for k, v in datatype.iteritems()))
+    elif dt_type is list:
+        return (dt_type, tuple(fingerprint(x) for x in datatype))
+    try:
+        return (dt_type, hash(datatype), datatype)
+    except TypeError:
+        return (dt_type, repr(datatype))
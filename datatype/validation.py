@@ -1,18 +1,25 @@
 """Datatype validation."""
 
-__all__ = ['failures', 'is_valid']
+__all__ = ['failures', 'failure_details', 'failures_many', 'is_valid',
+        'revalidate']
 
 from collections import defaultdict
 
-from datatype.tools import Choice, Literal, walk
+from datatype.compiler import cached_compile
+from datatype.language import primitives
+from datatype.tools import Choice, Literal, TaggedUnion, UnknownTag
 
 
 def is_valid(datatype, value):
-    """Return boolean representing validity of `value` against `datatype`."""
-    return not failures(datatype, value)
+    """Return boolean representing validity of `value` against `datatype`.
+
+    Validation stops at the first failure found, without building failure
+    messages.
+    """
+    return cached_compile(datatype).is_valid(value)
 
 
-def failures(datatype, value):
+def failures(datatype, value, cached=True):
     """Return list of failures (if any) validating `value` against `datatype`.
 
     Params:
@@ -20,28 +27,94 @@ def failures(datatype, value):
             for examples.
         `value`: Value to validate
         `path`: Used internally for location of failures.
+        `cached`: If false, don't use failures cached for an identical
+            value (see `datatype.compiler.ResultCache`).
 
     Example:
         >>> failures('int', 'foo')
         ['expected int, got str']
+
+    The analysed form of recently used datatypes is cached (see
+    `datatype.compiler.cached_compile`).  Failures of recently validated
+    values can be cached too, by giving `datatype.compiler.results` a
+    `maxsize`.
+    """
+    return cached_compile(datatype).failures(value, cached)
+
+
+def failure_details(datatype, value):
+    """Return list of failures (if any) validating `value` against
+    `datatype`, as `datatype.tools.Failure` objects.
+
+    Failures carry a machine-readable `code`, the `path` to the failing value
+    (a tuple of dictionary keys and list indices) and the `expected` and
+    `actual` values, so they can be filtered or aggregated without parsing
+    messages.  `render()` gives the message `failures` would return.
+
+    Example:
+        >>> fails = failure_details({'foo': ['int']}, {'foo': [1, 'a']})
+        >>> [(x.code, x.path, x.expected, x.actual) for x in fails]
+        [('type', ('foo', [1]), 'int', 'str')]
+        >>> fails[0].render()
+        'foo[1]: expected int, got str'
+    """
+    return cached_compile(datatype).failure_details(value)
+
+
+def failures_many(datatype, values, limit=None, workers=None):
+    """Return failures of each invalid record of `values`, by record index.
+
+    The datatype is analysed once for the whole batch, and records are
+    validated independently (failure paths are relative to the record).
+
+    Optional Arguments:
+        limit: stop validating after this many invalid records
+        workers: number of processes to validate with (see
+        `datatype.compiler.Validator.failures_many`)
+
+    Example:
+        >>> failures_many(['int'], [[1, 2], [3, 'a'], [], ['b']])
+        {1: ['[1]: expected int, got str'], 3: ['[0]: expected int, got str']}
+        >>> failures_many(['int'], [[1, 2], [3, 'a'], [], ['b']], limit=1)
+        {1: ['[1]: expected int, got str']}
     """
-    fails = []
+    return cached_compile(datatype).failures_many(values, limit, workers)
 
-    def validate(path, *args):
-        msg = '%s: %%s' % path if path else '%s'
-        fails.extend(msg % m for m in validate_step(*args) or [])
 
-    walk(datatype, value, validate)
+def revalidate(datatype, value, previous, changed):
+    """Return updated list of `datatype.tools.Failure` validating `value`
+    against `datatype`, after the values at paths `changed` were updated.
 
-    return fails
+    `previous` are the failures of `value` before it was updated (as given
+    by `failure_details`, or an earlier `revalidate`), and paths are
+    formatted as `walk` gives them ('foo[0].bar').  Only the changed values
+    and the keys of the dictionaries containing them are validated again
+    (see `datatype.compiler.Validator.revalidate`).
+
+    Example:
+        >>> datatype = {'foo': [{'bar': 'int'}]}
+        >>> value = {'foo': [{'bar': 1}, {'bar': 'a'}]}
+        >>> fails = failure_details(datatype, value)
+        >>> value['foo'][1]['bar'] = 2
+        >>> value['foo'][0]['baz'] = 3
+        >>> fails = revalidate(datatype, value, fails,
+        ...     ['foo[1].bar', 'foo[0].baz'])
+        >>> [x.render() for x in fails]
+        ['foo[0]: unexpected property "baz"']
+    """
+    return cached_compile(datatype).revalidate(value, previous, changed)
 
 
 def validate_step(datatype, value, options):
     """Validate simple value in datatype."""
     dtype, vtype = type(datatype), type(value)
 
+    # tags of tagged unions, selecting no variant (even if null)
+    if dtype == UnknownTag:
+        return ['unknown tag "%s"' % value]
+
     # nulls
-    if vtype is type(None):
+    elif vtype is type(None):
         if 'nullable' not in options:
             return ['unexpected null for non-nullable type']
 
@@ -83,17 +156,15 @@ def validate_step(datatype, value, options):
         if not any(is_valid(x, value) for x in datatype):
             return ['%s is none of expected %s' % (value, datatype)]
 
+    # tagged unions, with no variant selected
+    elif dtype == TaggedUnion:
+        if vtype not in (defaultdict, dict):
+            return ['expected dict, got %s' % vtype.__name__]
+        elif datatype.tag not in value:
+            return ['missing required property: "%s"' % datatype.tag]
+
     # literal values
     elif dtype == Literal:
         if datatype.value != value:
             return ['expected literal value "%s", got "%s"' % (datatype.value,
                 value)]
-
-
-primitives = {
-        'int':   (int,),
-        'float': (float,),
-        'str':   (str, unicode),
-        'bool':  (bool,)
-    }
-
@@ -6,7 +6,7 @@ setup(
     version='0.9a3',
     description='Anonymous datatype validation and coercion',
     long_description=open('README.rst').read(),
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     install_requires=['pytest', 'pytest-cov', 'doctools', 'mock'],
     author = 'Adam Wagner',
     author_email = 'awagner83@gmail.com',
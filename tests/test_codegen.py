@@ -0,0 +1,100 @@
+"""Tests for validator code generation."""
+
+from copy import deepcopy
+
+from datatype.codegen import generate
+from datatype.compiler import AnyNode, compile
+from datatype.language import named, reference
+from datatype.tools import Failure
+
+from test_compiler import parity_test_data, walk_failures
+
+
+def pytest_generate_tests(metafunc):
+    if "parity_test" in metafunc.funcargnames:
+        metafunc.parametrize("parity_test", parity_test_data)
+
+
+def test_failures_parity(parity_test):
+    datatype, values = parity_test
+    validator = compile(deepcopy(datatype), codegen=True)
+
+    for value in values:
+        expected = walk_failures(deepcopy(datatype), value)
+        assert validator.failures(value) == expected
+        assert validator.is_valid(value) == (not expected)
+
+
+def test_source():
+    assert compile('int').source is None
+
+    validator = compile({'foo': [{'bar': 'int'}]}, codegen=True)
+    assert 'def validate_0(value, path, fails):' in validator.source
+    assert "if k3 == 'foo':" in validator.source
+
+
+def test_wide_dict():
+    datatype = dict(('key%d' % i, 'int') for i in range(20))
+    validator = compile(datatype, codegen=True)
+    assert '_properties' in validator.source
+
+    value = dict(('key%d' % i, i) for i in range(20))
+    assert validator.failures(value) == []
+
+    value.update(key3='a', key5=None, extra=None)
+    assert sorted(validator.failures(value)) == sorted(
+            walk_failures(datatype, value))
+
+
+def test_recursive():
+    datatype = named('tree', {'value': 'int', 'children': [reference('tree')]})
+    validator = compile(deepcopy(datatype), codegen=True)
+    value = {'value': 1, 'children': [
+        {'value': 2, 'children': []},
+        {'value': 'a', 'children': [{'value': 3}]}]}
+
+    assert sorted(validator.failures(value)) == [
+            'children[1].children[0]: missing required property: "children"',
+            'children[1].value: expected int, got str']
+    assert validator.failures(value) == walk_failures(datatype, value)
+
+
+def test_fallback():
+    class NeverValid(AnyNode):
+        def failures(self, value, path, fails):
+            fails.append(Failure(path, 'literal', 'never', value))
+
+    source, validate = generate(NeverValid())
+    assert '.failures(value, path, fails)' in source
+
+    fails = []
+    validate(5, (None, 'foo', False), fails)
+    assert [x.render() for x in fails] == [
+            'foo: expected literal value "never", got "5"']
+
+
+def test_deep():
+    datatype, value = 'int', 1
+    for i in range(40):
+        datatype = {'a': [datatype]} if i % 2 else {'a': datatype}
+        value = {'a': [value]} if i % 2 else {'a': value}
+    validator = compile(datatype, codegen=True)
+    assert validator.source is not None
+    assert validator.failures(value) == []
+
+    bad = value
+    for i in range(39, 19, -1):
+        bad = bad['a'][0] if i % 2 else bad['a']
+    bad['a'] = None
+    assert validator.failures(value) == walk_failures(datatype, value)
+    assert len(validator.failures(value)) == 1
+
+
+def test_uncompilable(monkeypatch):
+    monkeypatch.setattr('datatype.codegen.max_inline_depth', 1000)
+    datatype = 'int'
+    for i in range(25):
+        datatype = {'a': datatype}
+    validator = compile(datatype, codegen=True)
+    assert validator.source is None
+    assert validator.failures({'a': 1}) == walk_failures(datatype, {'a': 1})
@@ -1,4 +1,11 @@
-from datatype.coercion import coerce_value
+from array import array
+
+from mock import patch
+from pytest import raises
+
+from datatype.coercion import coerce_array, coerce_value
+from datatype.compiler import PrimitiveNode
+from datatype.language import tagged_union
 
 
 def test_coerce_value():
@@ -17,3 +24,100 @@ def test_coerce_choice():
     assert coerce_value(datatype, 'a') == True
     assert coerce_value(datatype, '1') == 1
 
+
+
+def test_coerce_copy_on_write():
+    datatype = {'foo': ['int'], 'bar': ['int']}
+    value = {'foo': ['1', 2], 'bar': [3, 4]}
+
+    coerced = coerce_value(datatype, value)
+    assert coerced == {'foo': [1, 2], 'bar': [3, 4]}
+    assert coerced['bar'] is value['bar']
+    assert value['foo'] == ['1', 2]
+
+    unchanged = {'foo': [1], 'bar': []}
+    assert coerce_value(datatype, unchanged) is unchanged
+
+
+def test_coerce_inplace():
+    datatype = {'foo': ['int'], 'bar': ['int'], 'baz': [['int', 'str']]}
+    foo, bar, baz = ['1', 2], [3, 4], [['5', 6]]
+    value = {'foo': foo, 'bar': bar, 'baz': baz}
+
+    assert coerce_value(datatype, value, inplace=True) is value
+    assert value == {'foo': [1, 2], 'bar': [3, 4], 'baz': [[5, '6']]}
+    assert value['foo'] is foo and value['bar'] is bar
+    assert value['baz'] is baz
+
+    # Bulk coerced lists are updated a chunk at a time
+    values = ['1', 2, 'a', '4']
+    with patch('datatype.compiler.coerce_chunk_size', 2):
+        assert coerce_value(['int'], values, inplace=True) is values
+    assert values == [1, 2, 'a', 4]
+
+    # Only the top-level value itself may be replaced
+    assert coerce_value('int', '1', inplace=True) == 1
+
+
+def test_coerce_tagged_union():
+    datatype = [tagged_union('kind', {'a': {'x': 'int'}, 'b': {'x': 'str'}})]
+    value = [{'kind': 'a', 'x': '1'}, {'kind': 'b', 'x': 1},
+            {'kind': 'c', 'x': '1'}]
+    assert coerce_value(datatype, value) == [
+            {'kind': 'a', 'x': 1}, {'kind': 'b', 'x': '1'},
+            {'kind': 'c', 'x': '1'}]
+
+
+def test_coerce_list_bulk():
+    values = ['1', 2, '3.5', None, [4], u'5', 6.5, True]
+    expected = [1, 2, '3.5', None, [4], 5, 6, 1]
+    assert coerce_value(['int'], values) == expected
+    assert coerce_value(['nullable float'], ['1.5', None]) == [1.5, None]
+
+    # Chunks with incoercible values are coerced value by value
+    with patch('datatype.compiler.coerce_chunk_size', 2):
+        assert coerce_value(['int'], values) == expected
+        assert coerce_value(['str'], [1, u'a', None]) == ['1', 'a', None]
+
+    unchanged = [1, 2, 3]
+    assert coerce_value(['int'], unchanged) is unchanged
+
+
+def test_coerce_list_bulk_resumes():
+    # Values that fail to convert don't stop the rest of their chunk being
+    # converted in bulk
+    values = ['1.5', None, 'x', '2', [3], u'4', None]
+    with patch.object(PrimitiveNode, 'coerce') as coerce:
+        assert coerce_value(['nullable float'], values) == [
+                1.5, None, 'x', 2.0, [3], 4.0, None]
+        assert not coerce.called
+
+
+def test_coerce_array():
+    assert coerce_array(['int'], ['1', 2, 3.5]) == array('l', [1, 2, 3])
+    assert coerce_array(['float'], []) == array('d')
+    assert coerce_array(['int'], ['1'], 'b') == array('b', [1])
+
+    with raises(ValueError) as ex:
+        coerce_array(['int'], ['1', 'a'])
+    assert str(ex.value) == "cannot coerce 'a' to int"
+
+    with raises(ValueError) as ex:
+        coerce_array(['int'], [None])
+    assert str(ex.value) == "cannot coerce None to int"
+
+    with raises(ValueError) as ex:
+        coerce_array(['int'], ['99999999999999999999'])
+    assert str(ex.value) == 'cannot coerce 99999999999999999999L to int'
+
+    with raises(ValueError) as ex:
+        coerce_array(['float'], ['1.5'], 'l')
+    assert str(ex.value) == "float values do not fit array typecode 'l'"
+
+    with raises(ValueError) as ex:
+        coerce_array(['int'], ['300'], 'b')
+    assert str(ex.value) == "int values do not fit array typecode 'b'"
+
+    raises(ValueError, coerce_array, ['nullable int'], [1])
+    raises(ValueError, coerce_array, ['str'], ['a'])
+    raises(ValueError, coerce_array, 'int', 1)
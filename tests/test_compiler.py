@@ -0,0 +1,379 @@
+"""Tests for compiled datatypes."""
+
+import pickle
+
+from collections import OrderedDict
+from copy import deepcopy
+
+from mock import patch
+
+from datatype.coercion import coerce_step
+from datatype.compiler import (AnyNode, ChoiceNode, ListNode, LiteralNode,
+        ObjectNode, PrimitiveNode, ReferenceNode, TaggedUnionNode, TupleNode,
+        ResultCache, Validator, ValidatorCache, cache, cached_compile,
+        clear_cache, compile, results, to_datatype, to_node)
+from datatype.language import choice, literal, named, reference, tagged_union
+from datatype.tools import walk
+from datatype.validation import validate_step
+
+
+def walk_failures(datatype, value):
+    """Failures found by walking `value` with `validate_step`."""
+    fails = []
+
+    def validate(path, *args):
+        msg = '%s: %%s' % path if path else '%s'
+        fails.extend(msg % m for m in validate_step(*args) or [])
+
+    walk(datatype, value, validate, mode='readonly')
+    return fails
+
+
+def walk_coerce(datatype, value):
+    """Value coerced by walking it with `coerce_step`."""
+    return walk(datatype, value, coerce_step, mode='copy_on_write')
+
+
+person = named('person', {
+        'name': 'str',
+        'optional age': 'nullable int',
+        'children': [reference('person')]
+    })
+
+
+# parity_test_data :: [(datatype, [value])]
+parity_test_data = [
+        ('int', [5, '5', None, True, 1.0]),
+        ('nullable str', ['foo', u'foo', None, 5]),
+        (['int'], [[], [1, 2], [1, 'a', None], None, 'abc']),
+        (['int', 'str'], [[1, 'a'], [1], [1, 'a', 2], ['a', 1], None]),
+        ({'foo': 'int', 'optional bar': 'str'}, [
+            {'foo': 5}, {'foo': 5, 'bar': 1}, {}, {'baz': None}, 5, None,
+            {'foo': 'a', 'bif': 1, 'baz': 2, 'bar': 3}]),
+        ({'_any_': ['int']}, [{'foo': [1, 2], 'bar': ['a']}, {}, []]),
+        ({'foo': [{'bar': 'int'}]}, [
+            {'foo': [{'bar': 'baz'}], 'bif': 'pow!'},
+            {'foo': [{'bar': 1}, {}, None]}]),
+        (choice('int', 'str'), [5, 'foo', {}, None, 1.5]),
+        ([choice('int', {'foo': 'int'})], [[1, {'foo': 1}], [None]]),
+        (literal('foo'), ['foo', 'bar', None]),
+        (tagged_union('kind', {
+            'click': {'x': 'int', 'optional y': 'int'},
+            'key': {'code': 'str', 'kind': literal('key')}}), [
+            {'kind': 'click', 'x': 1}, {'kind': 'click', 'x': '1', 'z': 2},
+            {'kind': 'key', 'code': 'a'}, {'kind': 'key', 'x': 1},
+            {'kind': 'scroll'}, {'kind': None}, {'x': 1}, {}, 5, None]),
+        (named('event', tagged_union('kind', {
+            'key': {'code': 'str'},
+            'group': {'events': [reference('event')]}})), [
+            {'kind': 'group', 'events': [{'kind': 'key', 'code': 1}]},
+            {'kind': 'group', 'events': [None, {'kind': 'group'}]}]),
+        ({'defs': [named('a', {'x': 'int'})], 'event': tagged_union('kind', {
+            'a': reference('a'), 'b': {'y': 'str'}})}, [
+            {'defs': [], 'event': {'kind': 'a', 'x': 1}},
+            {'defs': [{'x': 1}], 'event': {'kind': 'a', 'x': 'b'}},
+            {'defs': [{'kind': 'a', 'x': 1}], 'event': {'kind': 'b'}}]),
+        ({'foo': [tagged_union('kind', {'a': {'x': 'int'}})]}, [
+            {'foo': [{'kind': 'a', 'x': 1}, {'kind': 'c'}, {'kind': None},
+                {'kind': []}, {'x': 1}, 'a']}]),
+        (choice({'kind': literal('circle'), 'radius': 'float'},
+            {'kind': literal('square'), 'side': 'float'}, ['int'], 'str'), [
+            {'kind': 'circle', 'radius': 1.5}, {'kind': 'square', 'side': 2.0},
+            [1], 'a', None]),
+        (person, [
+            {},
+            {'name': 'bob', 'children': []},
+            {'name': 'bob', 'age': None, 'children': [
+                {'name': 'jim'}, {'name': 5, 'children': [], 'age': 'x'}]}]),
+    ]
+
+
+def pytest_generate_tests(metafunc):
+    if "parity_test" in metafunc.funcargnames:
+        metafunc.parametrize("parity_test", parity_test_data)
+
+
+def test_failures_parity(parity_test):
+    datatype, values = parity_test
+    validator = compile(deepcopy(datatype))
+
+    for value in values:
+        expected = walk_failures(deepcopy(datatype), value)
+        assert validator.failures(value) == expected
+        assert validator.is_valid(value) == (not expected)
+
+
+def test_to_datatype_parity(parity_test):
+    datatype, values = parity_test
+    converted = to_datatype(to_node(deepcopy(datatype)))
+    validator, expected = compile(converted), compile(deepcopy(datatype))
+
+    for value in values:
+        assert validator.failures(value) == expected.failures(value)
+        assert validator.coerce(deepcopy(value)) == expected.coerce(
+                deepcopy(value))
+
+
+def test_coerce_parity(parity_test):
+    datatype, values = parity_test
+    validator = compile(deepcopy(datatype))
+
+    for value in values:
+        expected = walk_coerce(deepcopy(datatype), deepcopy(value))
+        assert validator.coerce(deepcopy(value)) == expected
+
+
+def test_compile():
+    validator = compile(['int'])
+    assert isinstance(validator, Validator)
+    assert validator.datatype == ['int']
+    assert validator.failures([1, 'a']) == ['[1]: expected int, got str']
+    assert validator.is_valid([1, 2])
+    assert not validator.is_valid([1, 'a'])
+    assert validator.coerce(['1', 'a']) == [1, 'a']
+
+    # Valid values build no failure locations
+    with patch.object(validator, '_failures') as failures:
+        assert validator.failures([1, 2]) == []
+    assert not failures.called
+
+
+def test_compile_reuse():
+    validator = compile({'foo': 'int'})
+    for _ in range(3):
+        assert validator.failures({'foo': 'a'}) == [
+                'foo: expected int, got str']
+
+
+def test_coerce_choice():
+    validator = compile(choice('int', 'bool'))
+    assert validator.coerce('a') == True
+    assert validator.coerce('1') == 1
+
+
+def test_choice_dispatch():
+    choices = [
+            {'kind': literal('circle'), 'radius': 'float'},
+            {'kind': literal('square'), 'side': 'float'},
+            {'kind': literal(1), 'optional size': 'int'},
+            'int', 'nullable str', ['bool'], literal(2.0)]
+    values = [
+            {'kind': 'circle', 'radius': 1.5}, {'kind': 'circle', 'side': 1.5},
+            {'kind': 'square', 'side': 1.5}, {'kind': 'oval'}, {'kind': []},
+            {'kind': 1}, {'kind': True, 'size': 2}, {'kind': 1.0}, {},
+            1, 2, 2.0, True, 'a', u'a', None, [], [True], [1], (1,)]
+
+    validator = compile(choice(*choices))
+    for value in values:
+        expected = value is not None and any(
+                compile(x).is_valid(value) for x in choices)
+        assert validator.is_valid(value) == expected, value
+
+    root = validator.root
+    assert root.discriminator == 'kind'
+    assert sorted(root.variants) == [1, 'circle', 'square']
+
+    # Only choices that could accept a type are checked
+    int_node, str_node, list_node, literal_node = root.nodes[3:]
+    assert root.dispatch[int] == (int_node, list_node, literal_node)
+    assert root.dispatch[unicode] == (str_node, list_node, literal_node)
+    assert root.dispatch[dict] == (list_node, literal_node)
+
+
+def test_choice_no_discriminator():
+    # 'kind' is optional in one choice, so can't tell choices apart
+    validator = compile(choice({'kind': literal('a'), 'x': 'int'},
+        {'optional kind': literal('b'), 'y': 'int'}))
+    assert validator.root.discriminator is None
+    assert validator.is_valid({'y': 1})
+    assert validator.is_valid({'kind': 'a', 'x': 1})
+    assert not validator.is_valid({'kind': 'b', 'x': 1})
+
+
+def test_coerce_copy_on_write():
+    validator = compile({'foo': ['int'], 'bar': ['int', 'str']})
+    value = {'foo': ['1', 2], 'bar': [3, 'a']}
+
+    coerced = validator.coerce(value)
+    assert coerced == {'foo': [1, 2], 'bar': [3, 'a']}
+    assert coerced['bar'] is value['bar']
+    assert value['foo'] == ['1', 2]
+    assert validator.coerce(coerced) is coerced
+
+
+def test_cached_compile():
+    clear_cache()
+    datatype = {'foo': 'int'}
+
+    validator = cached_compile(datatype)
+    assert cached_compile(datatype) is validator
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Mutated datatypes are recompiled
+    datatype['foo'] = 'str'
+    assert cached_compile(datatype) is not validator
+    assert validator.datatype == {'foo': 'int'}
+    assert cached_compile({'foo': 'int'}) is validator
+    assert cached_compile(datatype).is_valid({'foo': 'bar'})
+    assert (cache.hits, cache.misses) == (3, 2)
+
+    assert cached_compile(datatype, codegen=True).source
+
+    # Datatypes built for each call are looked up by structure
+    hits = cache.hits
+    assert cached_compile({'foo': 'str'}) is cached_compile(datatype)
+    assert cache.hits == hits + 2
+    assert cached_compile({'foo': u'str'}) is not cached_compile(datatype)
+
+    clear_cache()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_validator_cache_size():
+    lru = ValidatorCache(maxsize=2)
+    datatypes = ['int', ['int'], {'foo': 'int'}]
+
+    validators = [lru.get(x) for x in datatypes]
+    assert len(lru) == 2
+    assert lru.get(datatypes[2]) is validators[2]
+    assert lru.get(datatypes[0]) is not validators[0]
+
+    lru.maxsize = 0
+    lru.get('str')
+    assert len(lru) == 0
+
+
+def test_result_cache():
+    validator = compile({'foo': ['int']})
+    value = {'foo': [1, 'a']}
+
+    with patch.multiple(results, maxsize=2, results=OrderedDict()):
+        fails = validator.failures(value)
+        assert fails == ['foo[1]: expected int, got str']
+        with patch.object(validator, 'failure_details') as failure_details:
+            assert validator.failures(deepcopy(value)) == fails
+            assert not failure_details.called
+        assert (results.hits, results.misses) == (1, 1)
+
+        # Cached failures can't be changed by callers
+        validator.failures(value).append('bar')
+        assert validator.failures(value) == fails
+
+        # Mutated values, and values of other types, are validated again
+        value['foo'][1] = 2
+        assert validator.failures(value) == []
+        assert validator.failures({'foo': [1, 2.0]}) == [
+                'foo[1]: expected int, got float']
+        assert validator.failures({'foo': [1, True]}) == [
+                'foo[1]: expected int, got bool']
+        assert validator.failures({'foo': [1, lambda: 2]}) == [
+                'foo[1]: expected int, got function']
+        assert len(results) == 2
+
+        # Entries don't hold a copy of the values validated
+        validator.failures({'foo': range(10000)})
+        assert all(len(key[1]) == 20 for key in results.results)
+
+        # Caching can be skipped per call
+        hits = results.hits
+        assert validator.failures(value, cached=False) == []
+        assert results.hits == hits
+
+    assert results.maxsize == 0
+    results.clear()
+
+
+def test_result_cache_ttl():
+    validator = compile('int')
+    ttl = ResultCache(maxsize=2, ttl=10)
+
+    with patch('datatype.compiler.time', return_value=100):
+        assert ttl.failures(validator, 'a') == ['expected int, got str']
+        assert ttl.failures(validator, 'a') == ['expected int, got str']
+    with patch('datatype.compiler.time', return_value=110):
+        assert ttl.failures(validator, 'a') == ['expected int, got str']
+    assert (ttl.hits, ttl.misses) == (1, 2)
+
+    ttl.clear()
+    assert len(ttl) == 0
+    assert (ttl.hits, ttl.misses) == (0, 0)
+
+
+def test_compile_leaves_datatype_unchanged():
+    datatype = deepcopy(person)
+    compile(datatype)
+    assert datatype == person
+
+
+def test_recursive_references_linked():
+    validator = compile(deepcopy(person))
+    target = validator.root.properties['children'].item.target
+    assert target.properties['children'].item.target is target
+
+    # Named datatypes are only built once
+    assert target is validator.root
+
+
+def test_pickle():
+    for codegen in (False, True):
+        validator = pickle.loads(pickle.dumps(compile(person, codegen)))
+        assert (validator.source is None) != codegen
+        assert validator.failures({'name': 'bob', 'children': [{}]}) == [
+                'children[0]: missing required property: "name"',
+                'children[0]: missing required property: "children"']
+
+
+def test_failures_many_parallel():
+    validator = compile({'id': 'int'}, codegen=True)
+    values = [{'id': i if i % 7 else str(i)} for i in range(1000)]
+    expected = validator.failures_many(values)
+    assert len(expected) == 143
+
+    with patch.multiple('datatype.compiler', parallel_threshold=100,
+            parallel_chunk_size=30):
+        assert validator.failures_many(values, workers=3) == expected
+        assert validator.failures_many(iter(values), workers=2) == expected
+        assert validator.failures_many(values[:99], workers=2) == dict(
+                (i, v) for i, v in expected.items() if i < 99)
+
+        limited = validator.failures_many(values, limit=10, workers=2)
+        assert limited == dict(sorted(expected.items())[:10])
+
+
+def test_to_node_shares_primitives():
+    node = to_node({'foo': 'int', 'bar': ['int'], 'baz': 'nullable int',
+        '_any_': choice('int', None)})
+    assert node.properties['foo'] is node.properties['bar'].item
+    assert node.properties['foo'] is to_node('int')
+    assert node.properties['baz'] is not node.properties['foo']
+    assert node.default.nodes == (to_node('int'), to_node(None))
+
+    assert node.required_keys == frozenset(['foo', 'bar', 'baz'])
+    assert node.optional_keys == frozenset()
+    assert node.any_keys
+
+
+def test_nodes_slotted():
+    nodes = [to_node(x) for x in [None, 'int', ['int'], ['int', 'str'],
+        {'foo': 'int'}, choice('int', 'str'), literal(1),
+        tagged_union('kind', {'a': {}}), named('a', [reference('a')])]]
+    assert [type(x) for x in nodes] == [AnyNode, PrimitiveNode, ListNode,
+            TupleNode, ObjectNode, ChoiceNode, LiteralNode, TaggedUnionNode,
+            ListNode]
+    assert isinstance(nodes[-1].item, ReferenceNode)
+    for node in nodes:
+        assert not hasattr(node, '__dict__')
+
+    # Shared nodes stay shared once pickled
+    for node in nodes[:2]:
+        assert pickle.loads(pickle.dumps(node)) is node
+
+
+def test_to_datatype():
+    datatype = {'foo': 'nullable int', 'optional bar': [['int', 'str']],
+            'baz': choice('bool', literal(None))}
+    assert to_datatype(to_node(datatype)) == datatype
+    assert to_datatype(to_node(person)) == person
+    assert to_datatype(to_node(named('a', [reference('a')]))) == named(
+            'a', [reference('a')])
@@ -0,0 +1,120 @@
+"""Tests for schema-directed JSON decoding."""
+
+import json
+
+from pytest import raises
+
+from datatype.coercion import coerce_value
+from datatype.decoding import InvalidDocumentError, decode
+from datatype.language import choice, literal, named, reference, tagged_union
+from datatype.validation import failures
+
+
+person = named('person', {'name': 'str', 'children': [reference('person')]})
+
+# decode_test_data :: [(datatype, [JSON document])]
+decode_test_data = [
+        ('int', ['1', ' 2 ', '"3"', '1.5', 'null', 'true']),
+        ('nullable str', ['null', '"a"', '1']),
+        (['int'], ['[]', '[1, 2, 3]', '[1, "2", 3]', '[1, null]', '{}',
+            '"abc"', ' [ 1 , 2 ] ']),
+        (['int', 'str'], ['[1, "a"]', '[1]', '[]', '[1, "a", 2]',
+            '["a", 1]', '"ab"']),
+        ([], ['[]', '[1, "a"]', '1']),
+        ({'foo': 'int', 'optional bar': ['str']}, ['{"foo": 1}',
+            '{"foo": 1, "bar": ["a"]}', '{"bar": []}', '{"foo": "a"}',
+            '{"foo": 1, "baz": 2}', '{"foo": 1, "bar": [1]}', '[]', '{}',
+            '{"foo": 1, "bar": null}']),
+        ({'_any_': {'count': 'int'}}, ['{}', '{"a": {"count": 1}}',
+            '{"a": {"count": 1}, "b": {}}']),
+        ({'foo': 'int', '_any_': 'str'}, ['{"foo": 1, "bar": "a"}',
+            '{"foo": 1, "bar": 1}']),
+        ({'foo': choice('int', ['str'])}, ['{"foo": 1}',
+            '{"foo": ["a"]}', '{"foo": "a"}']),
+        ({'kind': literal('a')}, ['{"kind": "a"}', '{"kind": "b"}']),
+        ([tagged_union('kind', {'a': {'x': 'int'}, 'b': {'y': 'str'}})], [
+            '[{"kind": "a", "x": 1}, {"y": "b", "kind": "b"}]',
+            '[{"kind": "a", "y": "b"}]', '[{"kind": "c"}]', '[{}]']),
+        (person, ['{"name": "bob", "children": []}',
+            '{"name": "bob", "children": [{"name": "jim", "children": []}]}',
+            '{"name": "bob", "children": [{"name": "jim"}]}',
+            '{"name": "bob", "children": [{"name": 1, "children": []}]}']),
+        ({'foo': 'float', 'bar': ['bool']}, [
+            '{"foo": "1.5", "bar": [1, "0", true]}',
+            '{"foo": "x", "bar": []}']),
+    ]
+
+
+def pytest_generate_tests(metafunc):
+    if "decode_test" in metafunc.funcargnames:
+        metafunc.parametrize("decode_test", decode_test_data)
+
+
+def test_decode_matches_failures(decode_test):
+    datatype, documents = decode_test
+    for document in documents:
+        expected = failures(datatype, json.loads(document))
+        if not expected:
+            assert decode(datatype, document) == json.loads(document)
+            continue
+
+        with raises(InvalidDocumentError) as error:
+            decode(datatype, document)
+        assert len(error.value.failures) == 1
+        assert error.value.failures[0] in expected
+        assert str(error.value) == error.value.failures[0]
+
+
+def test_decode_coerce_matches_coerce_value(decode_test):
+    datatype, documents = decode_test
+    for document in documents:
+        coerced = coerce_value(datatype, json.loads(document))
+        expected = failures(datatype, coerced)
+        if not expected:
+            assert decode(datatype, document, coerce=True) == coerced
+            continue
+
+        with raises(InvalidDocumentError) as error:
+            decode(datatype, document, coerce=True)
+        assert error.value.failures[0] in expected
+
+
+def test_decode_rejects_early():
+    # Nothing after the first invalid value is parsed
+    with raises(InvalidDocumentError) as error:
+        decode([['int']], '[[1], ["a"], this is not json')
+    assert error.value.failures == ['[1][0]: expected int, got unicode']
+
+    with raises(InvalidDocumentError) as error:
+        decode({'foo': ['int']}, '{"bar": this is not json')
+    assert error.value.failures == ['unexpected property "bar"']
+
+    with raises(InvalidDocumentError) as error:
+        decode([['int'], ['int']], '[[1], [2], [3], this is not json')
+    assert error.value.failures == ['unexpected value at index 2']
+
+    # Containers of primitives are parsed whole
+    with raises(ValueError) as error:
+        decode(['int'], '[1, "a", this is not json')
+    assert not isinstance(error.value, InvalidDocumentError)
+
+
+def test_decode_invalid_json():
+    for document in ['', '[[1], [2]', '[[1] [2]]', '[[1],]', '{"foo": [1],}',
+            '{"foo" [1]}', '{foo: [1]}', '{"foo": [1]', '[[1]] 2', 'nul']:
+        datatype = [['int']] if document.startswith('[') else {'foo': ['int']}
+        with raises(ValueError) as error:
+            decode(datatype, document)
+        assert not isinstance(error.value, InvalidDocumentError)
+
+    with raises(ValueError) as error:
+        decode(['int'], '[1] [2]')
+    assert str(error.value) == str(raises(ValueError, json.loads,
+        '[1] [2]').value)
+
+
+def test_decode_unicode():
+    document = u'{"foo": ["\xe9", "\\u00e9"]}'
+    assert decode({'foo': ['str']}, document) == json.loads(document)
+    assert decode({'foo': ['str']}, document.encode('utf-8')) == {
+            'foo': [u'\xe9', u'\xe9']}
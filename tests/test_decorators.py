@@ -1,7 +1,8 @@
 from mock import patch
 from pytest import raises
 
-from datatype.decorators import BadReturnValueError, returns, returns_iter
+from datatype.decorators import (BadArgumentError, BadReturnValueError,
+        Sampler, accepts, returns, returns_iter)
 
 
 def test_returns():
@@ -43,6 +44,63 @@ def test_returns_strict():
         assert logger_mock.warning.called
 
 
+def test_returns_not_strict_bad_value():
+    # Key reads like the message of an unexpected property, but isn't one
+    @returns({'unexpected property': 'bool'}, strict=False)
+    def bad_function():
+        return {'unexpected property': 'yes'}
+
+    ex = raises(BadReturnValueError, bad_function)
+    assert ex.value.failures == [
+            'unexpected property: expected bool, got str']
+
+
+def test_returns_every():
+    @returns('int', every=3)
+    def bad_function():
+        return 'foo'
+
+    raises(BadReturnValueError, bad_function)
+    assert bad_function() == 'foo'
+    assert bad_function() == 'foo'
+    raises(BadReturnValueError, bad_function)
+
+
+def test_returns_first():
+    @returns('int', first=1)
+    def bad_function():
+        return 'foo'
+
+    raises(BadReturnValueError, bad_function)
+    assert bad_function() == 'foo'
+
+
+def test_returns_disabled():
+    @returns('int')
+    def bad_function():
+        return 'foo'
+
+    with patch('datatype.decorators.validation_enabled', False):
+        assert bad_function() == 'foo'
+    raises(BadReturnValueError, bad_function)
+
+
+def test_sampler_per_second():
+    sample = Sampler(per_second=2)
+    with patch('datatype.decorators.time') as time_mock:
+        time_mock.return_value = 100.0
+        assert [sample() for _ in range(3)] == [True, True, False]
+        time_mock.return_value = 101.5
+        assert [sample() for _ in range(3)] == [True, True, False]
+
+
+def test_sampler_combined():
+    sample = Sampler(every=2, first=5)
+    assert [sample() for _ in range(8)] == [
+            True, False, True, False, True, False, False, False]
+    raises(ValueError, Sampler, every=0)
+
+
 def test_returns_function_meta():
     @returns('int')
     def my_function():
@@ -76,6 +134,60 @@ def test_returns_iter_fail():
     assert ex.value.failures == ['expected int, got str']
 
 
+def test_returns_iter_batched():
+    consumed = []
+
+    @returns_iter('int', batch_size=2)
+    def bad_function():
+        for value in [1, 2, 3, 'foo', 5]:
+            consumed.append(value)
+            yield value
+
+    iter_result = bad_function()
+    assert next(iter_result) == 1
+    assert consumed == [1, 2]
+    assert next(iter_result) == 2
+
+    # bad value is found before any of its batch is yielded
+    ex = raises(BadReturnValueError, next, iter_result)
+    assert ex.value.failures == ['expected int, got str']
+    assert consumed == [1, 2, 3, 'foo']
+
+    @returns_iter('int', batch_size=2)
+    def good_function():
+        return iter(range(5))
+
+    assert list(good_function()) == range(5)
+
+    # Valid batches are validated in one call, not value by value
+    with patch('datatype.decorators._check_value') as check_value:
+        assert list(good_function()) == range(5)
+    assert not check_value.called
+
+
+def test_returns_iter_compiles_once():
+    with patch('datatype.decorators.compile') as compile_mock:
+        compile_mock.return_value.is_valid.return_value = True
+
+        @returns_iter('int')
+        def my_function():
+            yield 1
+            yield 2
+
+        assert list(my_function()) == [1, 2]
+        assert list(my_function()) == [1, 2]
+    compile_mock.assert_called_once_with('int')
+
+
+def test_returns_iter_disabled():
+    @returns_iter('int')
+    def bad_function():
+        yield 'foo'
+
+    with patch('datatype.decorators.validation_enabled', False):
+        assert list(bad_function()) == ['foo']
+
+
 def test_returns_iter_strict():
     val = {'expected': True, 'spanish inquisition': False}
 
@@ -96,3 +208,69 @@ def test_returns_iter_strict():
         assert list(still_too_much_stuff())
         assert logger_mock.warning.called
 
+
+
+def test_accepts():
+    @accepts({'foo': 'int', 'bar': ['str']})
+    def my_function(foo, bar=None, baz=None):
+        return foo, bar
+
+    # datatype should be transparent when all is well
+    assert my_function(1) == (1, None)
+    assert my_function(1, ['a'], 'anything') == (1, ['a'])
+    assert my_function(bar=['a'], foo=1) == (1, ['a'])
+
+
+def test_accepts_failure():
+    @accepts({'foo': 'int', 'bar': ['str']})
+    def my_function(foo, bar=None):
+        return foo, bar
+
+    ex = raises(BadArgumentError, my_function, 'a')
+    assert ex.value.failures == ['foo: expected int, got str']
+
+    ex = raises(BadArgumentError, my_function, 1, bar=['a', 2])
+    assert ex.value.failures == ['bar[1]: expected str, got int']
+
+
+def test_accepts_keywords():
+    @accepts({'foo': 'int'})
+    def my_function(**kwargs):
+        return kwargs
+
+    assert my_function(foo=1) == {'foo': 1}
+    raises(BadArgumentError, my_function, foo='a')
+
+
+def test_accepts_unknown_argument():
+    with raises(ValueError):
+        @accepts({'bar': 'int'})
+        def my_function(foo):
+            pass
+
+
+def test_accepts_strict():
+    @accepts({'foo': {'expected': 'bool'}}, strict=False)
+    def my_function(foo):
+        return foo
+
+    with patch('datatype.decorators.logger') as logger_mock:
+        assert my_function({'expected': True, 'other': 1})
+        logger_mock.warning.assert_called_once_with(
+                ['foo: unexpected property "other"'])
+
+    raises(BadArgumentError, my_function, {'expected': 1})
+
+    with patch('datatype.decorators.validation_enabled', False):
+        assert my_function({'expected': 1})
+
+
+def test_accepts_compiles_once():
+    with patch('datatype.decorators.compile') as compile_mock:
+        @accepts({'foo': 'int'})
+        def my_function(foo):
+            return foo
+
+        my_function(1)
+        my_function(2)
+    compile_mock.assert_called_once_with('int')
@@ -1,6 +1,7 @@
 """Tests for language module."""
 
-from datatype.language import typename, choice, named, reference, literal
+from datatype.language import (typename, choice, named, reference, literal,
+        tagged_union)
 
 
 def test_typename():
@@ -28,3 +29,8 @@ def test_reference():
 def test_literal():
     assert literal('str') == {'_type_': 'literal', 'value': 'str'}
 
+
+
+def test_tagged_union():
+    assert tagged_union('kind', {'a': 'int'}) == {
+            '_type_': 'tagged_union', 'tag': 'kind', 'variants': {'a': 'int'}}
@@ -0,0 +1,106 @@
+from mock import Mock, patch
+from pytest import raises
+
+from datatype.coercion import coerce_value
+from datatype.compiler import compile
+from datatype.decorators import BadReturnValueError, returns
+from datatype.profiling import (Stats, add_hook, count_values, hooks,
+        path_pattern, remove_hook)
+from datatype.tools import Index
+from datatype.validation import failures, is_valid
+
+
+def test_hooks():
+    hook = Mock()
+    validator = compile(['int'])
+
+    add_hook(hook)
+    try:
+        with patch('datatype.profiling.default_timer') as timer:
+            timer.side_effect = [1.0, 1.5]
+            assert validator.failures([1, 'a']) == [
+                    '[1]: expected int, got str']
+    finally:
+        remove_hook(hook)
+    assert hooks == []
+
+    (args, kwargs), = hook.call_args_list
+    assert args[:3] == (validator, 'failures', [1, 'a'])
+    assert [x.render() for x in args[3]] == ['[1]: expected int, got str']
+    assert args[4] == 0.5
+
+    # No longer called once removed
+    validator.failures([1, 'a'])
+    assert hook.call_count == 1
+
+
+def test_stats():
+    datatype = {'foo': [{'bar': 'int'}], 'baz': 'str'}
+
+    @returns(datatype)
+    def my_function():
+        return {'foo': [{'bar': 1}], 'baz': 'a'}
+
+    with Stats(sizes=True) as stats:
+        failures(datatype, {'foo': [{'bar': 'a'}, {'bar': 'b'}]})
+        is_valid(datatype, {'foo': [], 'baz': 1})
+        coerce_value(['int'], ['1', '2'])
+        my_function()
+    assert hooks == []
+
+    schema = stats.of(datatype)
+    assert schema.calls == 3
+    assert schema.values == 14
+    assert schema.invalid == 2
+    assert dict(schema.failure_codes) == {'missing_property': 1, 'type': 2}
+    assert dict(schema.failure_paths) == {'': 1, 'foo[].bar': 2}
+
+    assert stats.of(['int']).calls == 1
+    assert stats.of('str') is None
+    assert len(stats.summary()) == 2
+
+    stats.clear()
+    assert stats.of(datatype) is None
+
+    # Values aren't walked again unless asked for
+    with Stats() as stats:
+        with patch('datatype.profiling.count_values') as count:
+            failures(datatype, {'foo': [], 'baz': 'a'})
+    assert not count.called
+    assert stats.of(datatype).calls == 1
+    assert stats.of(datatype).values == 0
+
+
+def test_stats_mutated_datatype():
+    datatype = {'foo': 'int'}
+    with Stats() as stats:
+        failures(datatype, {'foo': 1})
+        datatype['foo'] = 'str'
+        failures(datatype, {'foo': 'a'})
+    assert stats.of({'foo': 'int'}).calls == 1
+    assert stats.of({'foo': 'str'}).calls == 1
+
+
+def test_stats_invalid_return():
+    datatype = {'foo': 'int'}
+
+    @returns(datatype)
+    def my_function():
+        return {'foo': 'a'}
+
+    with Stats() as stats:
+        with raises(BadReturnValueError):
+            my_function()
+    schema = stats.of(datatype)
+    assert (schema.calls, schema.invalid) == (1, 1)
+
+
+def test_count_values():
+    assert count_values(1) == 1
+    assert count_values({'a': [1, 2], 'b': {'c': None}}) == 6
+
+
+def test_path_pattern():
+    assert path_pattern(()) == ''
+    assert path_pattern(('foo', Index(0), 'bar', Index(1))) == 'foo[].bar[]'
+    assert path_pattern((Index(3), 'foo')) == '[].foo'
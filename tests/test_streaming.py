@@ -0,0 +1,84 @@
+"""Tests for streaming validation."""
+
+import json
+
+from StringIO import StringIO
+
+from pytest import raises
+
+from datatype.streaming import (iter_failures, iter_json_array,
+        iter_json_lines)
+from datatype.validation import failures
+
+
+records = [
+        {'id': 1, 'tags': ['a', 'b']},
+        {'id': 'two', 'tags': []},
+        {'id': 3, 'tags': [None]},
+        {'id': 12345678, 'tags': ['\xc3\xa9'.decode('utf-8')]},
+        {'tags': ['c']},
+    ]
+datatype = [{'id': 'int', 'tags': ['str']}]
+
+
+def test_iter_failures_matches_failures():
+    expected = failures(datatype, records)
+
+    for source in (records, iter(records)):
+        fails = list(iter_failures(datatype, source))
+        assert [i for i, _ in fails] == [1, 2, 4]
+        assert sum((x for _, x in fails), []) == expected
+
+
+def test_iter_failures_json_array():
+    source = StringIO(json.dumps(records))
+    fails = list(iter_failures(datatype, source))
+    assert fails == list(iter_failures(datatype, json.loads(
+        json.dumps(records))))
+
+
+def test_iter_failures_json_lines():
+    source = StringIO('\n'.join(json.dumps(x) for x in records))
+    fails = list(iter_failures(datatype, source, lines=True))
+    assert [i for i, _ in fails] == [1, 2, 4]
+
+
+def test_iter_failures_requires_list():
+    raises(ValueError, list, iter_failures({'foo': 'int'}, []))
+
+
+def test_iter_json_array_chunks():
+    text = json.dumps(records, ensure_ascii=False).encode('utf-8')
+    expected = json.loads(text)
+
+    for chunk_size in (1, 2, 3, 7, 64):
+        items = list(iter_json_array(StringIO(text), chunk_size))
+        assert items == expected
+
+
+def test_iter_json_array_split_numbers():
+    numbers = [1.25, -3, 2e-5, 10, 1.5e+30, 0.125]
+    text = '[%s]' % ', '.join(repr(x) for x in numbers)
+    for chunk_size in xrange(1, len(text) + 1):
+        assert list(iter_json_array(StringIO(text), chunk_size)) == numbers
+
+    text = '[ ' + ', '.join(['1.25'] * 30000) + ']'
+    assert list(iter_failures(['float'], StringIO(text))) == []
+
+
+def test_iter_json_array_whitespace():
+    text = ' \n[ 1 ,\n\t22 , "x" ] '
+    for chunk_size in (1, 4, 100):
+        assert list(iter_json_array(StringIO(text), chunk_size)) == [
+                1, 22, 'x']
+    assert list(iter_json_array(StringIO('[]'))) == []
+
+
+def test_iter_json_array_invalid():
+    for text in ('{}', '[1, 2', '[1 2]', '[1,]', '', '[1]x', '[1] [2]'):
+        raises(ValueError, list, iter_json_array(StringIO(text), 2))
+
+
+def test_iter_json_lines():
+    source = StringIO('{"a": 1}\n\n  [2]  \n')
+    assert list(iter_json_lines(source)) == [{'a': 1}, [2]]
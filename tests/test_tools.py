@@ -1,8 +1,13 @@
 """Tests for datatype internal utility functions."""
 
+from copy import deepcopy
+
 from mock import Mock, call
 
-from datatype.tools import (Choice, extract_named_types, walk)
+from pytest import raises
+
+from datatype.tools import (Choice, Failure, Index, NewValue,
+        extract_named_types, parse_path, tuple_length_failures, walk)
 
 
 # walk_test_data :: [(datatype, value, callback_call_args_list)]
@@ -113,3 +118,80 @@ def test_choice_obj():
     assert Choice([1]) == Choice([1])
     assert Choice([1]) != Choice([2])
 
+
+
+def test_walk_modes():
+    datatype = {'foo': ['int'], 'bar': ['int']}
+    value = {'foo': [1, 2], 'bar': [3, 4]}
+
+    def replace_twos(path, datatype, value, options):
+        if value == 2:
+            return NewValue('two')
+
+    copied = walk(datatype, value, replace_twos)
+    assert copied == {'foo': [1, 'two'], 'bar': [3, 4]}
+    assert copied['bar'] is not value['bar']
+
+    on_write = walk(datatype, value, replace_twos, mode='copy_on_write')
+    assert on_write == copied
+    assert on_write is not value
+    assert on_write['foo'] is not value['foo']
+    assert on_write['bar'] is value['bar']
+
+    inplace = deepcopy(value)
+    foo, bar = inplace['foo'], inplace['bar']
+    assert walk(datatype, inplace, replace_twos, mode='inplace') is inplace
+    assert inplace == copied
+    assert inplace['foo'] is foo and inplace['bar'] is bar
+
+    readonly = walk(datatype, value, replace_twos, mode='readonly')
+    assert readonly is value
+    assert value == {'foo': [1, 2], 'bar': [3, 4]}
+
+
+def test_extract_named_types_unchanged(extract_types_test):
+    datatype = extract_types_test[0]
+    original = deepcopy(datatype)
+
+    extract_named_types(datatype)
+    assert datatype == original
+
+
+def test_failure():
+    location = (((None, 'foo', False), 0, True), 'bar', False)
+    failure = Failure(location, 'type', 'int', 'str')
+
+    assert failure.path == ('foo', 0, 'bar')
+    assert isinstance(failure.path[1], Index)
+    assert failure.path_string() == 'foo[0].bar'
+    assert failure.message() == 'expected int, got str'
+    assert failure.render() == 'foo[0].bar: expected int, got str'
+    assert str(failure) == failure.render()
+
+    failure = Failure(None, 'missing_property', 'baz')
+    assert failure.path == ()
+    assert failure.render() == 'missing required property: "baz"'
+
+
+def test_parse_path():
+    assert parse_path('foo[0].bar') == ('foo', 0, 'bar')
+    assert isinstance(parse_path('foo[0]')[1], Index)
+    assert parse_path('[1][2]') == (1, 2)
+    assert parse_path('') == ()
+
+    path = Failure((((None, 'foo', False), 0, True), 'bar', False), 'null')
+    assert parse_path(path.path_string()) == path.path
+
+    for bad in ['.foo', 'foo.[0]', 'foo..bar', 'foo[0]bar', 'foo[x]']:
+        with raises(ValueError):
+            parse_path(bad)
+
+
+def test_failure_templates():
+    fails = []
+    tuple_length_failures(fails, None, 3, 1)
+    tuple_length_failures(fails, (None, 2, True), 1, 2)
+    assert [x.render() for x in fails] == [
+            'missing required value at index 1',
+            'missing required value at index 2',
+            '[2]: unexpected value at index 1']
@@ -1,9 +1,14 @@
 from collections import defaultdict
 
+from copy import deepcopy
+
+from mock import patch
 from pytest import raises
 
-from datatype.tools import Choice
-from datatype.validation import (failures, is_valid, validate_step)
+from datatype.language import named, reference, tagged_union
+from datatype.tools import Choice, parse_path
+from datatype.validation import (failure_details, failures, failures_many,
+        is_valid, revalidate, validate_step)
 
 
 def test_is_valid_primitive():
@@ -185,3 +190,149 @@ def test_failures_literal():
     assert failures(datatype, 'bar') == [
         'expected literal value "foo", got "bar"']
 
+
+
+def test_is_valid_fail_fast():
+    datatype = {'foo': 'int', 'bar': ['str']}
+    value = {'foo': 'a', 'bar': ['b', 3]}
+
+    with patch('datatype.compiler.Failure') as failure_mock:
+        assert not is_valid(datatype, value)
+        assert not failure_mock.called
+
+
+def test_is_valid_choice():
+    datatype = [{'_type_': 'choice', 'choices': ['int', {'foo': 'str'}]}]
+    assert is_valid(datatype, [1, {'foo': 'bar'}])
+    assert not is_valid(datatype, [1, {'foo': 5}])
+    assert failures(datatype, [None]) == [
+            '[0]: unexpected null for non-nullable type']
+
+
+def test_failures_many():
+    datatype = {'foo': 'int', 'optional bar': 'str'}
+    values = [{'foo': 1}, {'foo': 'a'}, {'foo': 2, 'bar': 3}, {}]
+
+    assert failures_many(datatype, values) == {
+            1: ['foo: expected int, got str'],
+            2: ['bar: expected str, got int'],
+            3: ['missing required property: "foo"'],
+        }
+    assert failures_many(datatype, iter(values), limit=2) == {
+            1: ['foo: expected int, got str'],
+            2: ['bar: expected str, got int'],
+        }
+    assert failures_many(datatype, values[:1]) == {}
+    assert failures_many(datatype, []) == {}
+
+
+def test_failure_details():
+    datatype = {'foo': ['int'], 'bar': ['str', 'bool'], 'baz': 'int'}
+    value = {'foo': [1, None, 'a'], 'bar': ['x'], 'qux': 1}
+    fails = failure_details(datatype, value)
+
+    assert sorted((x.code, x.path, x.expected, x.actual) for x in fails) == [
+            ('missing_property', (), 'baz', None),
+            ('missing_value', ('bar',), 1, None),
+            ('null', ('foo', 1), None, None),
+            ('type', ('foo', 2), 'int', 'str'),
+            ('unexpected_property', (), None, 'qux'),
+        ]
+    assert [x.render() for x in fails] == failures(datatype, value)
+    assert failure_details(datatype, {'foo': [], 'bar': ['x', True],
+        'baz': 1}) == []
+
+
+def test_failures_tagged_union():
+    datatype = [tagged_union('kind', {
+        'click': {'x': 'int'},
+        'key': {'code': 'str'}})]
+    value = [{'kind': 'click', 'x': 'a'}, {'kind': 'key', 'x': 1},
+            {'kind': 'scroll', 'y': 1}, {}]
+
+    assert failures(datatype, value) == [
+            '[0].x: expected int, got str',
+            '[1]: missing required property: "code"',
+            '[1]: unexpected property "x"',
+            '[2].kind: unknown tag "scroll"',
+            '[3]: missing required property: "kind"']
+
+    unknown = failure_details(datatype, value[2:3])[0]
+    assert unknown.code == 'unknown_tag'
+    assert unknown.path == (0, 'kind')
+    assert (unknown.expected, unknown.actual) == (['click', 'key'], 'scroll')
+
+    # Variants referring to named dictionaries needn't define the tag either
+    datatype = {'defs': [named('a', {'x': 'int'})],
+            'event': tagged_union('kind', {'a': reference('a')})}
+    assert failures(datatype, {'defs': [{'x': 1}],
+        'event': {'kind': 'a', 'x': 1}}) == []
+    assert failures(datatype, {'defs': [{'kind': 'a', 'x': 1}],
+        'event': {'kind': 'a', 'x': 1}}) == [
+            'defs[0]: unexpected property "kind"']
+
+
+# Marks a value removed by an update
+removed = object()
+
+person = {'_type_': 'named', 'name': 'person', 'value': {
+    'name': 'str', 'children': [{'_type_': 'reference', 'name': 'person'}]}}
+
+# revalidate_test_data :: [(datatype, value, {path: new value})]
+revalidate_test_data = [
+        ({'foo': ['int'], 'bar': 'str'}, {'foo': [1, 'a'], 'bar': 'x'},
+            {'foo[1]': 2}),
+        ({'foo': ['int'], 'bar': 'str'}, {'foo': [1, 'a'], 'bar': 'x'},
+            {'bar': removed, 'baz': 1}),
+        ({'foo': ['int'], 'bar': 'str'}, {'foo': [1, 'a'], 'baz': 1},
+            {'bar': 'x', 'baz': removed}),
+        ({'foo': ['int']}, {'foo': [1, 2, 'a']}, {'foo[2]': removed}),
+        ({'foo': ['int']}, {'foo': [1, 2]}, {'foo': None}),
+        ({'foo': ['int', 'str']}, {'foo': [1, 2, 3]},
+            {'foo[2]': removed, 'foo[1]': 'a'}),
+        ({'foo': [{'bar': 'int'}]}, {'foo': [{'bar': 'a'}]},
+            {'foo[0]': {}, 'foo[0].bar': 'b'}),
+        ({'foo': [{'bar': 'int'}]}, {'foo': [{'bar': 'a'}]},
+            {'foo[0].bar': 'b', 'foo[0]': {'bar': 1}}),
+        ({'foo': 'int'}, {'bar': 1}, {'': {'foo': 'a'}}),
+        ({'_any_': {'bar': 'int'}}, {'foo': {'bar': 'a'}}, {'foo.bar': 1}),
+        ({'foo': 'int'}, {'foo': 1, 'bar': {'baz': 1}}, {'bar.baz': None}),
+        ({'foo': {'_type_': 'choice', 'choices': [['int'], 'str']}},
+            {'foo': [1, 'a']}, {'foo[1]': 2}),
+        ([tagged_union('kind', {'a': {'x': 'int'}, 'b': {'y': 'str'}})],
+            [{'kind': 'a', 'x': 1}, {'kind': 'a', 'x': 'b'}],
+            {'[0].kind': 'b', '[1].x': 2}),
+        ([tagged_union('kind', {'a': {'x': 'int'}, 'b': {'y': 'str'}})],
+            [{'kind': 'c', 'x': 1}], {'[0].x': 'a'}),
+        (person, {'name': 'bob', 'children': [{'name': 1}]},
+            {'children[0].name': 'jim', 'children[0].children': [{}]}),
+    ]
+
+
+def update(value, changes):
+    """Return copy of `value` with `changes` applied."""
+    value = {'': deepcopy(value)}
+    for path, new in changes.iteritems():
+        path = ('',) + parse_path(path)
+        parent = reduce(lambda v, k: v[k], path[:-1], value)
+        if new is removed:
+            del parent[path[-1]]
+        else:
+            parent[path[-1]] = new
+    return value['']
+
+
+def pytest_generate_tests(metafunc):
+    if "revalidate_test" in metafunc.funcargnames:
+        metafunc.parametrize("revalidate_test", revalidate_test_data)
+
+
+def test_revalidate(revalidate_test):
+    datatype, value, changes = revalidate_test
+    previous = failure_details(datatype, value)
+    value = update(value, changes)
+
+    fails = revalidate(datatype, value, previous, changes)
+    assert sorted(x.render() for x in fails) == sorted(
+            failures(datatype, value))
+    assert revalidate(datatype, value, fails, []) == fails